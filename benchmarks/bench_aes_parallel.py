@@ -0,0 +1,34 @@
+"""
+Benchmark parallel CBC decryption and CTR in utils.aes against the number of workers.
+
+Run from the repository root: python -m benchmarks.bench_aes_parallel [size_in_MB]
+
+Defaults to 256 MB inputs and 1 up to os.cpu_count() workers.
+"""
+import os
+import sys
+import time
+
+from utils.aes import AES, Mode
+
+def throughput(mode: Mode, workers: int, ciphertext: bytes, key: bytes, iv: bytes) -> float:
+    """Returns decryption throughput in MB/s."""
+    cipher = AES(mode, workers=workers)
+    start = time.perf_counter()
+    cipher.decrypt(ciphertext, key, iv=iv)
+    elapsed = time.perf_counter() - start
+
+    return len(ciphertext) / elapsed / 1024 ** 2
+
+if __name__ == '__main__':
+    size = int(sys.argv[1]) * 1024 ** 2 if len(sys.argv) == 2 else 256 * 1024 ** 2
+    key, iv = os.urandom(AES.KEY_SIZE), os.urandom(AES.BLOCK_SIZE)
+    data = os.urandom(size)
+    worker_counts = sorted({1, 2, 4, 8, os.cpu_count() or 1})
+
+    print(f'{size // 1024 ** 2} MB, {os.cpu_count()} CPUs')
+    print(f'{"workers":>8} {"CBC decrypt (MB/s)":>20} {"CTR (MB/s)":>12}')
+    for workers in worker_counts:
+        cbc = throughput(Mode.CBC, workers, data, key, iv)
+        ctr = throughput(Mode.CTR, workers, data, key, iv)
+        print(f'{workers:>8} {cbc:>20.1f} {ctr:>12.1f}')
@@ -0,0 +1,34 @@
+"""
+Benchmark MT19937RNG output generation: one extract_number() call per value
+against extract_many() and fill().
+
+Run from the repository root: python -m benchmarks.bench_mt19937
+"""
+import time
+
+from set_3.c21_mt19937_rng import MT19937RNG
+
+COUNTS = [624, 10 ** 4, 10 ** 5, 10 ** 6]
+
+def bench(count: int, method: str) -> float:
+    """Returns the best time (in seconds) out of a few runs for generating count values."""
+    rng = MT19937RNG()
+    rng.seed_mt(5489)
+    best = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        if method == 'extract_number':
+            for _ in range(count):
+                rng.extract_number()
+        elif method == 'extract_many':
+            rng.extract_many(count)
+        else:
+            rng.fill(bytearray(4 * count))
+        best = min(best, time.perf_counter() - start)
+    return best
+
+if __name__ == '__main__':
+    methods = ['extract_number', 'extract_many', 'fill']
+    print(f'{"count":>10}' + ''.join(f'{method + " (ns/value)":>28}' for method in methods))
+    for count in COUNTS:
+        print(f'{count:>10}' + ''.join(f'{bench(count, method) / count * 1e9:>28.1f}' for method in methods))
@@ -0,0 +1,37 @@
+"""
+Benchmark utils.xor.xor from 16 B up to 100 MB.
+
+Run from the repository root: python -m benchmarks.bench_xor
+
+The ns/byte column should stay roughly flat as the size grows, i.e. the
+time taken scales linearly with the buffer size.
+"""
+import os
+import time
+
+from utils.xor import xor
+
+SIZES = [16, 256, 4 * 1024, 64 * 1024, 1024 ** 2, 16 * 1024 ** 2, 100 * 1024 ** 2]
+
+def bench(size: int, short_operand: bool = False, in_place: bool = False) -> float:
+    """Returns the best time (in seconds) out of a few runs for xoring size bytes."""
+    x = os.urandom(size)
+    y = os.urandom(16) if short_operand else os.urandom(size)
+    out = bytearray(size) if in_place else None
+    repeat = max(1, min(1000, (1024 ** 2) // size))
+    best = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            xor(x, y, out=out)
+        best = min(best, (time.perf_counter() - start) / repeat)
+    return best
+
+if __name__ == '__main__':
+    print(f'{"size":>12} {"equal (ns/B)":>14} {"repeat-16 (ns/B)":>18} {"out= (ns/B)":>13}')
+    for size in SIZES:
+        equal = bench(size)
+        repeating = bench(size, short_operand=True)
+        in_place = bench(size, in_place=True)
+        print(f'{size:>12} {equal / size * 1e9:>14.2f} {repeating / size * 1e9:>18.2f} '
+              f'{in_place / size * 1e9:>13.2f}')
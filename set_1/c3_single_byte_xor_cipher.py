@@ -18,67 +18,75 @@ You now have our permission to make "ETAOIN SHRDLU" jokes on Twitter.
 
 """
 
+import os
 import sys
+import heapq
 import string
-from typing import Tuple
+from typing import Iterable, List, Tuple, Union
+
+# Shared modules live in utils/ at the repository root.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.language_model import LanguageModel, RankModel, get_model
 
 hex_string = '1b37373331363f78151b7f2b783431333d78397828372d363c78373e783a393b3736'
 test_output = 'Cooking MC\'s like a pound of bacon'
 
 def single_byte_xor(msg_bytes: bytes, key_byte: bytes) -> bytes:
-    xor_ed = bytes()
-    for byte in msg_bytes:
-        xor_ed += bytes([byte ^ int.from_bytes(key_byte, 'big')])
-    return xor_ed
+    key = int.from_bytes(key_byte, 'big')
+    return msg_bytes.translate(bytes([byte ^ key for byte in range(256)]))
 
 def decode_hex(hex_string: str) -> bytes:
-    x = int(hex_string, 16)
-    return x.to_bytes((x.bit_length() + 7)//8, byteorder='big')
+    if len(hex_string) % 2:
+        hex_string = '0' + hex_string
+    return bytes.fromhex(hex_string)
 
-def text_score(text: str) -> int:
+def score_single_byte_xor_keys(cipher_bytes: bytes, top_n: int = 1,
+        candidate_keys: Iterable[int] = range(256),
+        model: Union[str, LanguageModel] = 'rank') -> List[Tuple[int, float]]:
     """
-    Return the score representing how likely the given text is 
-    valid english text.
+    Return a list of top_n (key, score) tuples, best first, of the candidate keys.
+
+    Keys are scored by the given language model (name, model file or instance; 
+    see utils.language_model.MODELS), which scores all keys from the ciphertext 
+    histogram instead of decrypting and scoring the text for every key. Among 
+    keys with equal score, the one later in candidate_keys ranks first.
     """
-    # TODO: Look for better text scoring algorithms.
-    frequency_order = ' etaoinsrhldcumfpgwybvkxjqz'
-    score = 0
-    for c in text:
-        pos = frequency_order.find(c.lower())
-        if(pos == -1):
-            score += pos
-        else:
-            score += (27 - pos)
+    candidate_keys = list(candidate_keys)
+    key_scores = get_model(model).score_keys(cipher_bytes, candidate_keys)
+    scores = [(score, index, key) for index, (key, score) in enumerate(zip(candidate_keys, key_scores))]
     
-    return score
+    return [(key, score) for score, _, key in heapq.nlargest(top_n, scores)]
 
-def crack_single_byte_xor_cipher(cipher_hex: str) -> Tuple[str, str, int]:
+def crack_single_byte_xor_cipher(cipher_hex: str, 
+        model: Union[str, LanguageModel] = 'rank') -> Tuple[str, str, float]:
     """
     Return a tuple with cracked message, crossponding key and score.
+
+    With the rank model, a best score below 0 means no key gives text, and 
+    ('', '', 0) is returned; the other models' scores can be negative for text.
     """
     cipher_bytes = decode_hex(cipher_hex)
-    best_score_msg, best_key, max_score = '', '', 0
-
-    for candidate_key in string.printable:
-        # Use 'iso-8859-1'/'latin-1' codec to avoid UnicodeDecodeError 
-        # as utf-8 being multibyte encoding doesnot define code points 
-        # for bytes with MSB bit '1' (i.e. 128-255)
-        plain_text = single_byte_xor(cipher_bytes, candidate_key.encode('utf-8'))\
-            .decode('iso-8859-1')
-
-        score = text_score(plain_text)
-        if(score >= max_score):
-            best_score_msg, best_key, max_score =  plain_text, candidate_key, score
+    candidate_keys = [ord(c) for c in string.printable]
+    language_model = get_model(model)
+    best_key, max_score = score_single_byte_xor_keys(cipher_bytes, 1, candidate_keys, language_model)[0]
+    if isinstance(language_model, RankModel) and max_score < 0:
+        return '', '', 0
+
+    # Use 'iso-8859-1'/'latin-1' codec to avoid UnicodeDecodeError 
+    # as utf-8 being multibyte encoding doesnot define code points 
+    # for bytes with MSB bit '1' (i.e. 128-255)
+    plain_text = single_byte_xor(cipher_bytes, bytes([best_key])).decode('iso-8859-1')
     
-    return best_score_msg, best_key, max_score
+    return plain_text, chr(best_key), max_score
 
 assert test_output == crack_single_byte_xor_cipher(hex_string)[0], 'Test Failed!'
 
 if __name__ == '__main__':
-    if(len(sys.argv) == 2):
+    if(len(sys.argv) in (2, 3)):
         cipher_hex = sys.argv[1]
-        cracked = crack_single_byte_xor_cipher(cipher_hex)
+        model = sys.argv[2] if len(sys.argv) == 3 else 'rank'
+        cracked = crack_single_byte_xor_cipher(cipher_hex, model)
         print(f'For key: {cracked[1]}, Plain text: {cracked[0]}')
     else:
-        print(f'Usage: {sys.argv[0]} <hex_string>')
+        print(f'Usage: {sys.argv[0]} <hex_string> [model]')
 
@@ -12,35 +12,112 @@ Find it.
 
 """
 
+import os
 import sys
-from typing import Tuple
+import time
+import heapq
+from argparse import ArgumentParser
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Callable, List, Tuple, Union
 
+# Shared modules live in utils/ at the repository root.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import c3_single_byte_xor_cipher as c3
+from utils.language_model import LanguageModel
 
 file_name = 'set_1/4.txt'
 test_output = 'Now that the party is jumping\n'
 
-def detect_single_byte_xor_from_file(file_name: str) -> Tuple[int, str, str, int]:
+def detect_single_byte_xor_from_file(file_name: str, 
+        model: Union[str, LanguageModel] = 'rank') -> Tuple[int, str, str, float]:
     """
     Returns a tuple with index of detected string, cracked message, key and score.
     """
     with open(file_name, 'r') as f:
-        best_cracked, max_score, index = tuple(), 0, 0
+        best_cracked, max_score, index = tuple(), float('-inf'), 0
 
         for i, line in enumerate(f):
             string = line[:-1] # removing newline character
-            cracked = c3.crack_single_byte_xor_cipher(string)
+            cracked = c3.crack_single_byte_xor_cipher(string, model)
             if(cracked[2] > max_score):
                 best_cracked, max_score, index =  cracked, cracked[2], i
     
     return index, *best_cracked
 
+def _crack_batch(first_index: int, lines: List[str], model: Union[str, LanguageModel],
+        top_k: int) -> List[Tuple[float, int, str, str]]:
+    """
+    Returns top_k (score, -index, message, key) tuples, best first, among the given lines.
+    """
+    cracked_lines = []
+    for i, line in enumerate(lines, first_index):
+        message, key, score = c3.crack_single_byte_xor_cipher(line.rstrip('\n'), model)
+        cracked_lines.append((score, -i, message, key))
+
+    return heapq.nlargest(top_k, cracked_lines)
+
+def scan_single_byte_xor_file(file_name: str, model: Union[str, LanguageModel] = 'rank',
+        top_k: int = 1, batch_size: int = 10000, workers: int = None,
+        progress: Callable[[int, float], None] = None) -> List[Tuple[int, str, str, float]]:
+    """
+    Returns top_k tuples with index of detected string, cracked message, key and 
+    score, best first.
+
+    The file is read in batches of batch_size lines which are cracked on a pool 
+    of worker processes, with only a few batches per worker in flight, so the 
+    file is never loaded fully. Batch results are merged into a bounded heap. 
+    progress, if given, is called with the number of lines done so far and lines 
+    per second after each batch.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    top = [] # min-heap of the best top_k (score, -index, message, key)
+    lines_done = 0
+    start_time = time.perf_counter()
+    with open(file_name, 'r') as f, ProcessPoolExecutor(max_workers=workers) as executor:
+        max_in_flight = 2 * workers
+        in_flight = deque()
+        first_index = 0
+        while True:
+            batch = list(islice(f, batch_size))
+            if batch:
+                in_flight.append((len(batch), executor.submit(_crack_batch, first_index, batch, model, top_k)))
+                first_index += len(batch)
+            if in_flight and (len(in_flight) >= max_in_flight or not batch):
+                batch_length, future = in_flight.popleft()
+                for cracked in future.result():
+                    if len(top) < top_k:
+                        heapq.heappush(top, cracked)
+                    else:
+                        heapq.heappushpop(top, cracked)
+                lines_done += batch_length
+                if progress is not None:
+                    elapsed = time.perf_counter() - start_time
+                    progress(lines_done, lines_done / elapsed if elapsed else 0.0)
+            if not batch and not in_flight:
+                break
+
+    return [(-negative_index, message, key, score) 
+            for score, negative_index, message, key in sorted(top, reverse=True)]
+
+def print_progress(lines_done: int, lines_per_second: float) -> None:
+    print(f'{lines_done} lines; {lines_per_second:.0f} lines/s', file=sys.stderr)
+
 assert test_output == detect_single_byte_xor_from_file(file_name)[1], 'Test Failed!'
 
 if __name__ == '__main__':
-    if(len(sys.argv) == 2):
-        file_name = sys.argv[1]
-        detected = detect_single_byte_xor_from_file(file_name)
-        print(f'{detected[0]}th string; key: {detected[2]}; message: {detected[1]}')
-    else:
-        print(f'Usage: {sys.argv[0]} <file_name>')
+    parser = ArgumentParser()
+    parser.add_argument('file_name')
+    parser.add_argument('model', nargs='?', default='rank', help='Language model name or file')
+    parser.add_argument('-w', '--workers', type=int, help='Number of worker processes (default: CPU count)')
+    parser.add_argument('-k', '--top-k', type=int, default=1, help='Number of best strings to report')
+    parser.add_argument('-b', '--batch-size', type=int, default=10000, help='Lines per batch')
+    parser.add_argument('-p', '--progress', action='store_true', help='Report progress on stderr')
+
+    args = parser.parse_args()
+    detected_strings = scan_single_byte_xor_file(args.file_name, args.model, args.top_k, args.batch_size,
+                                                 args.workers, print_progress if args.progress else None)
+    for detected in detected_strings:
+        print(f'{detected[0]}th string; key: {detected[2]}; score: {detected[3]}; message: {detected[1]}')
@@ -27,6 +27,7 @@ I go crazy when I hear a cymbal'''
 key = 'ICE'
 test_output = '0b3637272a2b2e63622c2e69692a23693a2a3c6324202d623d63343c2a26226324272765272'\
     'a282b2f20430a652e2c652a3124333a653e2b2027630c692b20283165286326302e27282f'
+CHUNK_SIZE = 1 << 20
 
 def byte_xor(byte_one: bytes, byte_two: bytes) -> bytes:
     x1 = int.from_bytes(byte_one, 'big')
@@ -43,23 +44,37 @@ def repeating_key_xor(message: str, key: str) -> bytes:
     
     return message_xor
 
-def repeating_key_xor_file(file_name: str, key: str, output_file: str = None) -> None:
+def repeating_key_xor_file(file_name: str, key: str, output_file: str = None,
+                           chunk_size: int = CHUNK_SIZE) -> None:
     """
     Encrypts the given file and outputs to output_file.
+
+    The file is processed chunk_size bytes at a time, so files larger than
+    memory can be encrypted. Each chunk is xored in one go against the key
+    repeated to chunk length, starting at the key position reached so far.
     """
     if output_file is None:
         output_file = f'{file_name}.rxor'
+    if chunk_size < 1:
+        raise ValueError('Chunk size must be positive')
     
-    key_length = len(key)
+    key_bytes = bytes([ord(c) for c in key])
+    key_length = len(key_bytes)
+    # Key repeated to cover a chunk starting at any key position
+    tiled_key = key_bytes * (chunk_size // key_length + 2)
+    chunk = bytearray(chunk_size)
+    chunk_view = memoryview(chunk)
     with open(file_name, 'rb') as fr, open(output_file, 'wb') as fw:
         i = 0
         while True:
-            b = fr.read(1)
-            if not b:
+            n = fr.readinto(chunk)
+            if not n:
                 break
-            b_xor = byte_xor(b, bytes([ord(key[i%key_length])]))
-            fw.write(b_xor)
-            i += 1
+            key_position = i % key_length
+            x1 = int.from_bytes(chunk_view[:n], 'big')
+            x2 = int.from_bytes(tiled_key[key_position:key_position+n], 'big')
+            fw.write((x1 ^ x2).to_bytes(n, 'big'))
+            i += n
 
 assert test_output == repeating_key_xor(message, key).hex(), 'Test Failed!'
 
@@ -67,6 +82,8 @@ if __name__ == '__main__':
     parser = ArgumentParser()
     parser.add_argument('-f', '--file', metavar='file_name', type=str, nargs=1, help='Encrypt/Decrypt given file')
     parser.add_argument('-o', '--output', metavar='output_file', type=str, nargs=1, help='File to output to')
+    parser.add_argument('-c', '--chunk-size', metavar='chunk_size', type=int, default=CHUNK_SIZE,
+                        help=f'Bytes of the file processed at a time (default: {CHUNK_SIZE})')
     parser.add_argument('message', nargs='?')
     parser.add_argument('key', nargs=1)
 
@@ -76,7 +93,7 @@ if __name__ == '__main__':
             output = args.output[0]
         else:
             output = None
-        repeating_key_xor_file(args.file[0], args.key[0], output)
+        repeating_key_xor_file(args.file[0], args.key[0], output, args.chunk_size)
     
     if args.message is not None:
         print(f'Cipher: {repeating_key_xor(args.message, args.key[0]).hex()}')
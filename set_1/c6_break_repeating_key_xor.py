@@ -33,27 +33,33 @@ We get more tech support questions for this challenge than any of the other ones
 
 """
 
+import os
+import sys
 import base64
-from typing import Union, Tuple
+import string
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Union, Tuple
 
+# Shared modules live in utils/ at the repository root.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import c3_single_byte_xor_cipher as c3
-import c5_repeating_key_xor as c5
+from utils.language_model import LanguageModel, get_model
+
+# Key bytes tried for each key position
+CANDIDATE_KEYS = [ord(c) for c in string.printable]
+
+def popcount(x: int) -> int:
+    """Returns number of 1's in x."""
+    return x.bit_count() if hasattr(x, 'bit_count') else bin(x).count('1')
 
 def hamming_distance(s_one: Union[bytes, str], s_two: Union[bytes, str]) -> int:
     bytes_one = bytes(s_one, 'ascii') if type(s_one) is str else s_one 
     bytes_two = bytes(s_two, 'ascii') if type(s_two) is str else s_two
-    xor_bytes = bytes()
-    for i, j in zip(bytes_one, bytes_two):
-        xor_bytes += bytes([i ^ j])
-
-    h_distance = 0
-    x = int.from_bytes(xor_bytes, 'big')
-    # count number of 1's
-    while x:
-        h_distance += x & 1
-        x >>= 1
+    length = min(len(bytes_one), len(bytes_two))
 
-    return h_distance
+    # xor the whole strings as integers and count the 1's at once
+    x = int.from_bytes(bytes_one[:length], 'big') ^ int.from_bytes(bytes_two[:length], 'big')
+    return popcount(x)
 
 def get_cipher_text_from_file(file_name: str) -> bytes:
     with open(file_name, 'r') as f:
@@ -62,42 +68,110 @@ def get_cipher_text_from_file(file_name: str) -> bytes:
 
     return cipher_text
 
-def guess_key_size(cipher_text: bytes) -> int:
-    smallest_normalized_h_distance = 8
-    guessed_key_size = 2
-    for key_size in range(2, 40):
-        s = 0
-        no_of_blocks = len(cipher_text)//key_size
-        for i in range(no_of_blocks):
-            block_one = cipher_text[i*key_size:key_size*(i+1)]
-            block_two = cipher_text[key_size*(i+1):key_size*(i+2)]
-            normalized_h_distance = hamming_distance(block_one, block_two)/key_size
-            s += normalized_h_distance
-        
-        avg = s/no_of_blocks
-        if smallest_normalized_h_distance > avg:
-            smallest_normalized_h_distance = avg
-            guessed_key_size = key_size
-
-    return guessed_key_size
-
-def crack_repeating_key_xor(cipher_text: bytes) -> Tuple[str, str]:
+def rank_key_sizes(cipher_text: bytes, min_key_size: int = 2, 
+        max_key_size: int = 40) -> List[Tuple[int, float, float]]:
+    """
+    Returns (key size, normalized hamming distance, confidence) for every key size 
+    from min_key_size to max_key_size, most likely key size first.
+
+    For each key size the ciphertext is compared against itself shifted by the key 
+    size, i.e. every block against the next one, in a single xor and popcount. The 
+    normalized distance is the number of differing bits per byte. The confidence is 
+    how many standard deviations the distance is below the mean over all key sizes.
+    """
+    max_key_size = min(max_key_size, len(cipher_text) // 2)
+    if max_key_size < min_key_size:
+        raise ValueError('Cipher text is too short for the given key sizes')
+
+    distances = []
+    for key_size in range(min_key_size, max_key_size + 1):
+        compared_length = len(cipher_text) - key_size
+        h_distance = hamming_distance(cipher_text[:compared_length], cipher_text[key_size:])
+        distances.append((key_size, h_distance / compared_length))
+
+    mean = sum(distance for _, distance in distances) / len(distances)
+    stdev = (sum((distance - mean) ** 2 for _, distance in distances) / len(distances)) ** 0.5
+    ranked = [(key_size, distance, (mean - distance) / stdev if stdev else 0.0)
+              for key_size, distance in distances]
+    
+    return sorted(ranked, key=lambda candidate: candidate[1])
+
+def guess_key_size(cipher_text: bytes, max_key_size: int = 40) -> int:
+    return rank_key_sizes(cipher_text, max_key_size=max_key_size)[0][0]
+
+def repeating_key_xor_bytes(text: bytes, key: bytes) -> bytes:
+    """Returns text xored with key repeated to the text length."""
+    tiled_key = key * (len(text) // len(key) + 1)
+    xored = int.from_bytes(text, 'big') ^ int.from_bytes(tiled_key[:len(text)], 'big')
+    return xored.to_bytes(len(text), 'big')
+
+def shortest_period(key: bytes) -> bytes:
+    """Returns the shortest key which repeated gives key, e.g. b'ab' for b'ababab'."""
+    for period in range(1, len(key)):
+        if len(key) % period == 0 and key[:period] * (len(key) // period) == key:
+            return key[:period]
+    return key
+
+def _solve_column(column: bytes, model: Union[str, LanguageModel]) -> int:
+    return c3.score_single_byte_xor_keys(column, 1, CANDIDATE_KEYS, model)[0][0]
+
+def break_repeating_key_xor(cipher_text: bytes, top_n: int = 3, 
+        model: Union[str, LanguageModel] = 'rank', workers: int = 1,
+        margin: float = 0.1, max_key_size: int = 40) -> List[Tuple[bytes, float]]:
+    """
+    Returns a list of (key, score) tuples for the candidate keys, best first.
+
+    Keys are solved for the top_n most likely key sizes, most likely first. The 
+    transposed columns (raw bytes) of each key size are solved as single-byte 
+    xor, on a pool of worker processes if workers > 1. Each full key is scored 
+    by the language model score per byte of its plaintext. Keys that are 
+    repetitions of a shorter key are reduced to it, so multiples of the key 
+    size do not count as separate candidates. Stops early once the best key 
+    scores at least margin (relative) above every other candidate.
+    """
+    language_model = get_model(model)
+    key_sizes = [key_size for key_size, _, _ in rank_key_sizes(cipher_text, max_key_size=max_key_size)[:top_n]]
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    candidates = {}
+    try:
+        for key_size in key_sizes:
+            columns = [cipher_text[i::key_size] for i in range(key_size)]
+            if executor is None:
+                key_bytes = [_solve_column(column, language_model) for column in columns]
+            else:
+                key_bytes = list(executor.map(_solve_column, columns, [model] * key_size))
+            key = shortest_period(bytes(key_bytes))
+            if key in candidates:
+                continue
+
+            plain_text = repeating_key_xor_bytes(cipher_text, key)
+            candidates[key] = language_model.score(plain_text) / len(plain_text)
+            if len(candidates) >= 2:
+                best_score, second_score = sorted(candidates.values(), reverse=True)[:2]
+                if best_score - second_score >= margin * abs(second_score):
+                    break
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return sorted(candidates.items(), key=lambda candidate: candidate[1], reverse=True)
+
+def crack_repeating_key_xor(cipher_text: bytes, 
+        model: Union[str, LanguageModel] = 'rank', workers: int = 1) -> Tuple[str, str]:
     """
     Returns a tuple with cracked key and message.
     """
-    key_size = guess_key_size(cipher_text)
-    key = ''
-    for i in range(key_size):
-        ith_block = bytes([cipher_text[k] for k in range(i, len(cipher_text), key_size)])
-        key += c3.crack_single_byte_xor_cipher(ith_block.hex())[1]
+    key = break_repeating_key_xor(cipher_text, model=model, workers=workers)[0][0]
+    message = repeating_key_xor_bytes(cipher_text, key)
     
-    return key, c5.repeating_key_xor(cipher_text.decode(), key).decode()
+    return key.decode('iso-8859-1'), message.decode('iso-8859-1')
 
 assert hamming_distance('this is a test', 'wokka wokka!!!') == 37, 'Hamming distance failed!'
 
 if __name__ == '__main__':
+    model = sys.argv[1] if len(sys.argv) == 2 else 'rank'
     cipher_text = get_cipher_text_from_file('set_1/6.txt')
-    key, message = crack_repeating_key_xor(cipher_text)
+    key, message = crack_repeating_key_xor(cipher_text, model)
     print(f'Key: {key}')
     assert key == 'Terminator X: Bring the noise'
     print(f'Message: {message}')
@@ -14,26 +14,115 @@ Remember that the problem with ECB is that it is stateless and deterministic; th
 
 """
 
+import gzip
+from argparse import ArgumentParser
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import IO, Iterator, List, Tuple
+
+BATCH_SIZE = 1000
+
 def no_of_repeated_blocks(cipher_text: bytes, block_size: int) -> int:
+    # Blocks are hashed as memoryview slices of the cipher text, without copies.
+    view = memoryview(cipher_text).toreadonly()
     no_of_blocks = len(cipher_text)//block_size
-    blocks = [cipher_text[i*block_size:(i+1)*block_size] for i in range(no_of_blocks)]
+    blocks = {view[i*block_size:(i+1)*block_size] for i in range(no_of_blocks)}
     
-    return no_of_blocks - len(set(blocks))
+    return no_of_blocks - len(blocks)
+
+def _open(file_name: str, mode: str) -> IO:
+    """Opens the file, transparently decompressing gzip files."""
+    with open(file_name, 'rb') as f:
+        is_gzip = f.read(2) == b'\x1f\x8b'
+    if is_gzip:
+        return gzip.open(file_name, mode)
+    return open(file_name, mode)
+
+def read_records(file_name: str, input_format: str = 'hex', record_size: int = 4096) -> Iterator[bytes]:
+    """
+    Yields the cipher texts in the file; one per line for 'hex' format, or 
+    consecutive record_size byte records for 'raw' binary format.
+    """
+    if input_format == 'hex':
+        with _open(file_name, 'rt') as f:
+            for line in f:
+                yield bytes.fromhex(line.rstrip())
+    elif input_format == 'raw':
+        with _open(file_name, 'rb') as f:
+            while True:
+                record = f.read(record_size)
+                if not record:
+                    break
+                yield record
+    else:
+        raise ValueError(f'Unsupported input format {input_format}')
+
+def _score_batch(records: List[bytes], block_size: int) -> List[Tuple[int, int, float]]:
+    scores = []
+    for record in records:
+        no_of_blocks = len(record)//block_size
+        repeated = no_of_repeated_blocks(record, block_size)
+        scores.append((repeated, no_of_blocks, repeated/no_of_blocks if no_of_blocks else 0.0))
+    return scores
 
-def detect_aes_ecb_mode(file_name: str) -> bytes:
+def score_records(records: Iterator[bytes], block_size: int = 16, 
+        workers: int = 1) -> Iterator[Tuple[int, int, int, float]]:
+    """
+    Yields (record index, repeated blocks, blocks, repetition score) for each record 
+    in order, where repetition score is the fraction of blocks that repeat an 
+    earlier block of the same record.
+
+    With workers > 1, batches of records are scored on a pool of worker processes 
+    with a bounded number of batches in flight, so the input is streamed.
+    """
+    batches = iter(lambda: list(islice(records, BATCH_SIZE)), [])
+    if workers == 1:
+        results = (_score_batch(batch, block_size) for batch in batches)
+    else:
+        results = _score_batches_in_pool(batches, block_size, workers)
+
+    index = 0
+    for scores in results:
+        for repeated, no_of_blocks, score in scores:
+            yield index, repeated, no_of_blocks, score
+            index += 1
+
+def _score_batches_in_pool(batches: Iterator[List[bytes]], block_size: int, 
+        workers: int) -> Iterator[List[Tuple[int, int, float]]]:
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+        for batch in batches:
+            in_flight.append(executor.submit(_score_batch, batch, block_size))
+            if len(in_flight) >= 2 * workers:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+def detect_aes_ecb_mode(file_name: str) -> List[str]:
     """
     Returns list of ecb encrypted cipher texts among all of the cipher texts in the given file.
     """
-    with open(file_name, 'r') as f:
-        ecb_detected_cipher_texts = []
-        for cipher_text in f:
-            n = no_of_repeated_blocks(bytes.fromhex(cipher_text.rstrip()), block_size=16)
-            if n > 0:
-                ecb_detected_cipher_texts.append(cipher_text.rstrip())
+    ecb_detected_cipher_texts = []
+    for cipher_text in read_records(file_name):
+        n = no_of_repeated_blocks(cipher_text, block_size=16)
+        if n > 0:
+            ecb_detected_cipher_texts.append(cipher_text.hex())
     
     return ecb_detected_cipher_texts
 
 if __name__ == '__main__':
-    print(detect_aes_ecb_mode('set_1/8.txt'))
-
+    parser = ArgumentParser()
+    parser.add_argument('file_name', nargs='?', default='set_1/8.txt', help='Plain or gzip compressed file')
+    parser.add_argument('-f', '--format', choices=['hex', 'raw'], default='hex', 
+                        help='hex: a hex encoded cipher text per line; raw: binary fixed size records')
+    parser.add_argument('-r', '--record-size', type=int, default=4096, help='Record size for raw format')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='Number of worker processes')
+    parser.add_argument('-t', '--threshold', type=float, default=0.0, 
+                        help='Report records with repetition score above this')
 
+    args = parser.parse_args()
+    records = read_records(args.file_name, args.format, args.record_size)
+    for index, repeated, no_of_blocks, score in score_records(records, workers=args.workers):
+        if score > args.threshold:
+            print(f'Record {index}: {repeated}/{no_of_blocks} repeated blocks; score: {score:.3f}')
@@ -23,11 +23,15 @@ Detect the block cipher mode the function is using each time. You should end up
 """
 
 import os
+import sys
 import random
 from typing import Callable
 
+# Shared modules live in utils/ at the repository root.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import c10_cbc_mode as c10
 import c9_pkcs7_padding as c9
+from utils.oracle import SyncOracle
 
 BLOCK_SIZE = 16
 
@@ -74,11 +78,13 @@ def detect_oracle_encryption_mode(oracle: Callable[[bytes], bytes]) -> str:
     return is_ecb_or_cbc(ciphertext)
 
 if __name__ == '__main__':
-    oracle = encryption_oracle
+    # Not cached: the oracle picks a new key and mode on every query.
+    oracle = SyncOracle(encryption_oracle)
 
     detected_modes = []
     for i in range(10):
         detected_modes.append(detect_oracle_encryption_mode(oracle))
     print(detected_modes)
+    print(oracle.stats)
     
     assert detected_modes == ORACLE_ENCRYPTION_MODE_LOG
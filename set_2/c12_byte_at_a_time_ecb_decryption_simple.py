@@ -9,11 +9,15 @@ https://cryptopals.com/sets/2/challenges/12
 """
 
 import os
+import sys
 import base64
-from typing import Callable, List
+from typing import Callable, Dict
 
+# Shared modules live in utils/ at the repository root.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import c9_pkcs7_padding as c9
 import c10_cbc_mode as c10
+from utils.oracle import SyncOracle
 
 BLOCK_SIZE = 16
 RANDOM_KEY = os.urandom(16)
@@ -57,35 +61,51 @@ def is_ecb(ciphertext: bytes, block_size: int) -> bool:
         return True
     return False
 
-def construct_check_dictionary(oracle: Callable[[bytes], bytes], 
-        block_size: int, one_byte_short_block: bytes) -> List[bytes]:
-    check_dictionary = []
-    for i in range(256):
-        check_dictionary.append(oracle(one_byte_short_block+bytes([i]))[:block_size])
+def construct_check_dictionary(ciphertext: bytes, block_size: int) -> Dict[bytes, int]:
+    """
+    Returns map from cipher block to last byte, for the 256 probe blocks at the 
+    start of the given ciphertext (see probe_blocks).
+    """
+    return {ciphertext[i*block_size:(i+1)*block_size]: i for i in range(256)}
 
-    return check_dictionary
+def probe_blocks(one_byte_short_block: bytes) -> bytes:
+    """Returns the 256 blocks of one_byte_short_block followed by each possible byte."""
+    return b''.join(one_byte_short_block + bytes([i]) for i in range(256))
 
 def crack_unknown_string(oracle: Callable[[bytes], bytes], block_size: int) -> bytes:
+    """
+    Returns the unknown string, using a single oracle query per byte.
+
+    Each query packs the 256 probe blocks for the byte, followed by the 
+    padding that puts the byte at the end of a block; both the check 
+    dictionary and the block to look up come from the same ciphertext.
+    """
     unknown_string = b''
     unknown_string_length = len(oracle(b''))
-    for i in range(1, unknown_string_length+1):
-        i_byte_short_playload = b'A' * (unknown_string_length - i)
-        cipher_block = oracle(i_byte_short_playload)[unknown_string_length-block_size:unknown_string_length]
-        
+    probes_length = 256 * block_size
+    for i in range(unknown_string_length):
+        i_byte_short_playload = b'A' * (block_size - 1 - i % block_size)
         one_byte_short_block = (i_byte_short_playload + unknown_string)[-block_size+1:]
-        check_dictionary = construct_check_dictionary(oracle, block_size, one_byte_short_block)
-        try:
-            ith_byte = check_dictionary.index(cipher_block)
-            unknown_string += bytes([ith_byte])
-        except ValueError:
-            # for padding bytes values doesnot match as padding bytes changes 
-            # with decrease in length.
-            pass
+
+        ciphertext = oracle(probe_blocks(one_byte_short_block) + i_byte_short_playload)
+        check_dictionary = construct_check_dictionary(ciphertext, block_size)
+        cipher_block_start = probes_length + (i // block_size) * block_size
+        ith_byte = check_dictionary.get(ciphertext[cipher_block_start:cipher_block_start+block_size])
+        if ith_byte is None:
+            # Padding bytes change with decrease in length, so the first mismatch 
+            # means the previous byte was the first padding byte (\x01).
+            break
+        unknown_string += bytes([ith_byte])
+    # Either way the last byte cracked is the first padding byte (\x01); when the 
+    # unknown string is one byte short of a whole block, no mismatch comes before 
+    # running out of ciphertext.
+    unknown_string = unknown_string[:-1]
 
     return unknown_string
     
 if __name__ == '__main__':
-    oracle = encryption_oracle
+    # The oracle is deterministic, so repeated queries are answered from the cache.
+    oracle = SyncOracle(encryption_oracle, cache_size=1024)
     
     block_size = get_block_size(oracle)
     print(f'Block Size: {block_size}')
@@ -99,4 +119,12 @@ if __name__ == '__main__':
     if ecb:
         unknown_string = crack_unknown_string(oracle, block_size)
         print(f'Unknown String: {unknown_string}')
+        print(oracle.stats)
+        assert unknown_string == get_unknown_string(), 'Test Failed!'
+
+        # Unknown strings of every length modulo the block size
+        for length in list(range(3 * block_size)) + [143]:
+            secret = os.urandom(length)
+            secret_oracle = lambda message: c10.aes_ecb_encrypt(c9.PKCS7_pad(message + secret, BLOCK_SIZE), RANDOM_KEY)
+            assert crack_unknown_string(secret_oracle, block_size) == secret, f'Test Failed for length {length}!'
 
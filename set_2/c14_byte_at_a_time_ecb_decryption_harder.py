@@ -9,12 +9,16 @@ https://cryptopals.com/sets/2/challenges/14
 """
 
 import os
+import sys
 import random
 from typing import Callable, List, Tuple
 
+# Shared modules live in utils/ at the repository root.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import c9_pkcs7_padding as c9
 import c10_cbc_mode as c10
 import c12_byte_at_a_time_ecb_decryption_simple as c12
+from utils.oracle import SyncOracle
 
 BLOCK_SIZE = 16
 RANDOM_KEY = os.urandom(16)
@@ -90,7 +94,7 @@ def crack_unknown_string(oracle: Callable[[bytes], bytes], block_size: int) -> b
     return unknown_string
 
 if __name__ == '__main__':
-    oracle = encryption_oracle
+    oracle = SyncOracle(encryption_oracle, cache_size=1024)
     
     block_size = c12.get_block_size(oracle)
     print(f'Block Size: {block_size}')
@@ -104,3 +108,4 @@ if __name__ == '__main__':
     if ecb:
         unknown_string = crack_unknown_string(oracle, block_size)
         print(f'Unknown String: {unknown_string}')
+        print(oracle.stats)
@@ -7,9 +7,14 @@ CBC bitflipping attacks
 https://cryptopals.com/sets/2/challenges/16
 """
 import os
+import sys
+from typing import Callable
 
+# Shared modules live in utils/ at the repository root.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import c9_pkcs7_padding as c9
 import c10_cbc_mode as c10
+from utils.oracle import SyncOracle
 
 BLOCK_SIZE = 16
 RANDOM_KEY = os.urandom(16)
@@ -34,12 +39,12 @@ def is_admin(ciphertext: bytes) -> bool:
 
     return False
 
-def get_userdata_block_number() -> int:
+def get_userdata_block_number(oracle: Callable[[bytes], bytes] = encrypt) -> int:
     """Returns the block number which contains user provided data"""
-    initial_ciphertext = encrypt(b'A')
+    initial_ciphertext = oracle(b'A')
     initial_cipher_blocks = [initial_ciphertext[i:i+BLOCK_SIZE] for i in range(0, len(initial_ciphertext), BLOCK_SIZE)]
 
-    next_ciphertext = encrypt(b'B')
+    next_ciphertext = oracle(b'B')
     next_cipher_blocks = [next_ciphertext[i:i+BLOCK_SIZE] for i in range(0, len(next_ciphertext), BLOCK_SIZE)]
 
     userdata_block_number = 0
@@ -51,12 +56,12 @@ def get_userdata_block_number() -> int:
     
     return userdata_block_number
 
-def get_playload_prefix(userdata_block_no: int) -> bytes:
-    previous_userdata_block = encrypt(b'')[userdata_block_no*BLOCK_SIZE:(userdata_block_no+1)*BLOCK_SIZE]
+def get_playload_prefix(userdata_block_no: int, oracle: Callable[[bytes], bytes] = encrypt) -> bytes:
+    previous_userdata_block = oracle(b'')[userdata_block_no*BLOCK_SIZE:(userdata_block_no+1)*BLOCK_SIZE]
     prefix_no = 0
     for i in range(BLOCK_SIZE):
         prefix = b'A' * (i+1)
-        userdata_block = encrypt(prefix)[userdata_block_no*BLOCK_SIZE:(userdata_block_no+1)*BLOCK_SIZE]
+        userdata_block = oracle(prefix)[userdata_block_no*BLOCK_SIZE:(userdata_block_no+1)*BLOCK_SIZE]
         if previous_userdata_block == userdata_block:
             prefix_no = i
             break
@@ -64,12 +69,12 @@ def get_playload_prefix(userdata_block_no: int) -> bytes:
 
     return b'A' * prefix_no
 
-def get_modified_ciphertext() -> bytes:
-    userdata_block_number = get_userdata_block_number()
-    playload_prefix = get_playload_prefix(userdata_block_number)
+def get_modified_ciphertext(oracle: Callable[[bytes], bytes] = encrypt) -> bytes:
+    userdata_block_number = get_userdata_block_number(oracle)
+    playload_prefix = get_playload_prefix(userdata_block_number, oracle)
     
     playload = playload_prefix + b'A' * BLOCK_SIZE + b'?admin?true'
-    ciphertext = encrypt(playload)
+    ciphertext = oracle(playload)
     cipher_blocks = [ciphertext[i:i+BLOCK_SIZE] for i in range(0, len(ciphertext), BLOCK_SIZE)]
 
     if playload_prefix:
@@ -93,7 +98,9 @@ if __name__ == '__main__':
     admin = is_admin(ciphertext)
     print(f'Is Admin: {admin}')
 
-    modified_ciphertext = get_modified_ciphertext()
+    oracle = SyncOracle(encrypt, cache_size=64)
+    modified_ciphertext = get_modified_ciphertext(oracle)
     admin = is_admin(modified_ciphertext)
     print(f'Is Admin: {admin}')
+    print(oracle.stats)
     assert admin == True, 'Admin Test Failed!'
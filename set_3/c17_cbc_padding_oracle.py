@@ -9,10 +9,15 @@ https://cryptopals.com/sets/3/challenges/17
 import os
 import random
 import base64
+import asyncio
+from argparse import ArgumentParser
+from typing import Awaitable, Callable, List, Sequence, Tuple, Union
 
 from utils.xor import xor
 from utils.padding import PKCS7, PaddingError
 from utils.aes import AES, Mode
+from utils.language_model import LanguageModel, get_model
+from utils.oracle import AsyncOracle, SyncOracle
 
 STRING_CHOICES = [
             'MDAwMDAwTm93IHRoYXQgdGhlIHBhcnR5IGlzIGp1bXBpbmc=',
@@ -53,11 +58,43 @@ class CBCPaddingOracle:
 
         return True
 
-def padding_oracle_attack(padding_oracle: CBCPaddingOracle, ciphertext: bytes, iv: bytes, block_size: int) -> bytes:
+def plaintext_byte_order(text_order: Sequence[int], cracked_suffix: bytes, block_size: int,
+        last_block: bool) -> List[int]:
+    """
+    Returns all byte values, most likely first, for the plaintext byte before 
+    cracked_suffix (the already cracked end of the block). text_order is the 
+    byte values ordered by their likelihood in text; the last block ends with 
+    PKCS#7 padding, so padding bytes are tried first there.
+    """
+    preferred = []
+    if last_block:
+        if not cracked_suffix:
+            preferred = range(1, block_size + 1)
+        elif len(cracked_suffix) < cracked_suffix[-1]:
+            preferred = [cracked_suffix[-1]]
+
+    return list(dict.fromkeys([*preferred, *text_order]))
+
+def _text_byte_order(model: Union[str, LanguageModel]) -> List[int]:
+    byte_scores = get_model(model).byte_scores
+    return sorted(range(256), key=lambda byte: byte_scores[byte], reverse=True)
+
+def padding_oracle_attack(padding_oracle: Union[CBCPaddingOracle, Callable[[bytes, bytes], bool]], 
+        ciphertext: bytes, iv: bytes, block_size: int, model: Union[str, LanguageModel] = 'unigram') -> bytes:
     """
     Returns plaintext for the given ciphertext and iv from padding oracle.
+
+    padding_oracle is either a CBCPaddingOracle or an oracle called with 
+    (ciphertext, iv) as its decrypt_and_check (e.g. utils.oracle.SyncOracle).
+
+    Byte flips are tried in the order of the plaintext bytes they would reveal, 
+    most likely first under the language model (see plaintext_byte_order), so 
+    text takes a few queries per byte instead of about 128.
     """
+    if isinstance(padding_oracle, CBCPaddingOracle):
+        padding_oracle = padding_oracle.decrypt_and_check
     no_of_blocks = len(ciphertext) // block_size
+    text_order = _text_byte_order(model)
     plaintext = b''
 
     # We crack a block at a time. Each time we take two blocks; block to be cracked 
@@ -67,43 +104,155 @@ def padding_oracle_attack(padding_oracle: CBCPaddingOracle, ciphertext: bytes, i
         # This is the current block to be cracked.
         current_block = ciphertext[i*block_size:(i+1)*block_size]
 
-        # Currently cracked plain block; which is empty initially.
-        plain_block = b''
+        # Output of decryption before xor with previous cipher block; filled from the last byte.
+        ecb_decrypted = bytearray(block_size)
+        # The playload is built in place; random bytes before the byte being cracked.
+        iv_playload = bytearray(os.urandom(block_size))
         for j in range(block_size):
             # Cracking is done from last byte to first.
             current_byte_index = block_size - j - 1
-            # Output of decryption before xor with previous cipher block; Only for those bytes 
-            # that are already cracked.
-            ecb_decrypted = xor(plain_block, previous_block[current_byte_index+1:])
-            # For cracking each byte in a block, we take every possible byte flip in previous cipher block.
-            random_iv = os.urandom(AES.BLOCK_SIZE)
-            for k in range(1, 256):
-                # For each byte, take random iv bytes upto that byte, filp the byte. 
-                # So there is identical byte filp in plaintext.
-                iv_playload = random_iv[:-(j+1)] + bytes([k])
-                # All the remaining bytes for playload are flipped so that valid padding
-                # would be produced.
-                iv_playload += xor(ecb_decrypted, bytes([j+1])*j)
-                # Check if byte filps makes padding valid
-                is_valid = padding_oracle.decrypt_and_check(current_block, iv_playload)
-                if is_valid:
-                    # Slice object for obtaining current byte. We perform slicing instead of indexing
-                    # because we donot want integer when the cipher block is indexed; we want single byte.
-                    byte_index = slice(current_byte_index, current_byte_index+1)
-
-                    ecb_decrypted_plain_byte = xor(bytes([j+1]), bytes([k]))
-                    plain_byte = xor(ecb_decrypted_plain_byte, previous_block[byte_index])
-                    # Since craking is done from last byte to first, cracked byte is added at first
-                    plain_block = plain_byte + plain_block
+            padding_byte = j + 1
+            # All the bytes after the cracked one are flipped so that they decrypt to padding bytes.
+            for index in range(current_byte_index + 1, block_size):
+                iv_playload[index] = ecb_decrypted[index] ^ padding_byte
+
+            cracked_suffix = xor(ecb_decrypted[current_byte_index+1:], previous_block[current_byte_index+1:])
+            for plain_byte in plaintext_byte_order(text_order, cracked_suffix, block_size, i == no_of_blocks - 1):
+                # The byte flip making the plaintext byte decrypt to padding_byte, if plain_byte is right.
+                k = plain_byte ^ previous_block[current_byte_index] ^ padding_byte
+                iv_playload[current_byte_index] = k
+                if padding_oracle(current_block, iv_playload) and (
+                        j > 0 or current_byte_index == 0 or _is_single_byte_padding(
+                            padding_oracle, current_block, iv_playload, current_byte_index)):
+                    ecb_decrypted[current_byte_index] = k ^ padding_byte
                     break
+            else:
+                raise ValueError('No byte flip produces valid padding')
 
-        plaintext += plain_block
+        plaintext += xor(ecb_decrypted, previous_block)
         previous_block = current_block
 
     return plaintext
 
+def _is_single_byte_padding(padding_oracle: Callable[[bytes, bytes], bool], current_block: bytes,
+        iv_playload: bytearray, index: int) -> bool:
+    """
+    Checks that the valid padding of the last byte is \x01 and not the end of a 
+    longer padding (e.g. \x02\x02); that one breaks when the byte before it changes.
+    """
+    iv_playload[index - 1] ^= 0xff
+    is_valid = padding_oracle(current_block, iv_playload)
+    iv_playload[index - 1] ^= 0xff
+
+    return is_valid
+
+async def _find_valid_byte(padding_oracle: Callable[[bytes, bytes], Awaitable[bool]], current_block: bytes,
+        probes: List[Tuple[int, bytes]], semaphore: asyncio.Semaphore,
+        verify: Callable[[int], Awaitable[bool]]) -> int:
+    """
+    Returns a byte flip k of the (k, iv_playload) probes for which the oracle 
+    reports valid padding and verify(k) holds. Probes are sent in order, each one 
+    as soon as the semaphore has a free slot, and no more are sent once the byte 
+    is found. An exception raised by the oracle is raised here, and the probes 
+    still in flight are cancelled.
+    """
+    found = asyncio.get_running_loop().create_future()
+
+    async def check(k: int, iv_playload: bytes) -> None:
+        try:
+            if await padding_oracle(current_block, iv_playload) and await verify(k) and not found.done():
+                found.set_result(k)
+        except Exception as e:
+            # An oracle error ends the search, and is raised by found.result() below.
+            if not found.done():
+                found.set_exception(e)
+        finally:
+            semaphore.release()
+
+    tasks = []
+    for k, iv_playload in probes:
+        await semaphore.acquire()
+        if found.done():
+            semaphore.release()
+            break
+        tasks.append(asyncio.ensure_future(check(k, iv_playload)))
+
+    pending = set(tasks)
+    while pending and not found.done():
+        _, pending = await asyncio.wait(pending | {found}, return_when=asyncio.FIRST_COMPLETED)
+        pending.discard(found)
+    # Probes still in flight are not needed anymore.
+    for task in pending:
+        task.cancel()
+    if not found.done():
+        raise ValueError('No byte flip produces valid padding')
+
+    return found.result()
+
+async def _crack_block_async(padding_oracle: Callable[[bytes, bytes], Awaitable[bool]], previous_block: bytes,
+        current_block: bytes, block_size: int, semaphore: asyncio.Semaphore, text_order: Sequence[int],
+        last_block: bool) -> bytes:
+    # Output of decryption before xor with previous cipher block; filled from the last byte.
+    ecb_decrypted = bytearray(block_size)
+    random_iv = os.urandom(block_size)
+    for j in range(block_size):
+        current_byte_index = block_size - j - 1
+        padding_byte = j + 1
+        # The bytes after the flipped one are set so that they decrypt to padding bytes.
+        padding_suffix = bytes(b ^ padding_byte for b in ecb_decrypted[current_byte_index+1:])
+        iv_prefix = random_iv[:current_byte_index]
+        cracked_suffix = xor(ecb_decrypted[current_byte_index+1:], previous_block[current_byte_index+1:])
+        flips = [plain_byte ^ previous_block[current_byte_index] ^ padding_byte 
+                 for plain_byte in plaintext_byte_order(text_order, cracked_suffix, block_size, last_block)]
+        probes = [(k, iv_prefix + bytes([k]) + padding_suffix) for k in flips]
+
+        async def verify(k: int) -> bool:
+            # The last byte may also give valid padding by ending a longer padding 
+            # (e.g. \x02\x02); it does not if the byte before it is changed.
+            if j > 0 or current_byte_index == 0:
+                return True
+            changed_iv = iv_prefix[:-1] + bytes([iv_prefix[-1] ^ 0xff, k])
+            return await padding_oracle(current_block, changed_iv)
+
+        k = await _find_valid_byte(padding_oracle, current_block, probes, semaphore, verify)
+        ecb_decrypted[current_byte_index] = k ^ padding_byte
+
+    return xor(ecb_decrypted, previous_block)
+
+async def padding_oracle_attack_async(padding_oracle: Callable[[bytes, bytes], Awaitable[bool]],
+        ciphertext: bytes, iv: bytes, block_size: int, max_in_flight: int = 64,
+        model: Union[str, LanguageModel] = 'unigram') -> bytes:
+    """
+    Returns plaintext for the given ciphertext and iv from an asynchronous padding 
+    oracle called with (ciphertext, iv) (e.g. utils.oracle.AsyncOracle).
+
+    Cracking a block only needs the block before it, so all blocks are attacked 
+    concurrently and the probes for each byte are pipelined; at most max_in_flight 
+    probes are waiting for the oracle at any time. Probes are ordered as in 
+    padding_oracle_attack.
+    """
+    if max_in_flight < 1:
+        raise ValueError('At least one probe must be allowed in flight')
+    semaphore = asyncio.Semaphore(max_in_flight)
+    text_order = _text_byte_order(model)
+    blocks = [iv] + [ciphertext[i:i+block_size] for i in range(0, len(ciphertext), block_size)]
+    plain_blocks = await asyncio.gather(*(
+        _crack_block_async(padding_oracle, blocks[i], blocks[i+1], block_size, semaphore, text_order,
+                           i == len(blocks) - 2)
+        for i in range(len(blocks) - 1)))
+
+    return b''.join(plain_blocks)
+
 
 if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('-l', '--latency', type=float, default=0.0, help='Simulated oracle latency in seconds')
+    parser.add_argument('-j', '--jitter', type=float, default=0.0, help='Simulated oracle latency jitter in seconds')
+    parser.add_argument('-n', '--in-flight', type=int, default=64,
+                        help='Maximum probes in flight (0 runs the sequential attack)')
+    parser.add_argument('-m', '--model', default='unigram', help='Language model name or file ordering the probes')
+    args = parser.parse_args()
+
     padding_oracle = CBCPaddingOracle()
     
     # Test if the oracle functions are working correctly
@@ -114,8 +263,15 @@ if __name__ == '__main__':
     
     ciphertext, iv = padding_oracle.select_and_encrypt()
     block_size = AES.BLOCK_SIZE
-    plaintext = padding_oracle_attack(padding_oracle, ciphertext, iv, block_size)
+    if args.in_flight:
+        oracle = AsyncOracle(padding_oracle.decrypt_and_check, latency=args.latency, jitter=args.jitter)
+        plaintext = asyncio.run(padding_oracle_attack_async(oracle, ciphertext, iv, block_size, args.in_flight,
+                                                            args.model))
+    else:
+        oracle = SyncOracle(padding_oracle.decrypt_and_check, latency=args.latency, jitter=args.jitter)
+        plaintext = padding_oracle_attack(oracle, ciphertext, iv, block_size, args.model)
+    assert PKCS7.unpad(plaintext) in [base64.b64decode(s) for s in STRING_CHOICES], 'Test Failed!'
     
     print(plaintext)
-    
-
+    print(oracle.stats)
+    print(f'Mean oracle queries per byte: {oracle.stats.queries / len(ciphertext):.1f}')
@@ -7,10 +7,14 @@ Break fixed-nonce CTR mode using substitutions
 https://cryptopals.com/sets/3/challenges/19
 """
 import os
+import cmd
 import base64
-from typing import List
+from argparse import ArgumentParser
+from typing import List, Union
 
+from utils.language_model import LanguageModel, get_model
 from utils.aes import AES, Mode
+from utils.xor import xor
 
 def produce_ciphertexts(filename: str) -> List[bytes]:
     """
@@ -29,8 +33,151 @@ def produce_ciphertexts(filename: str) -> List[bytes]:
     
     return ciphertexts
 
+class SubstitutionSession:
+    """
+    Incrementally break ciphertexts encrypted under a fixed nonce CTR keystream 
+    by guessing the keystream byte at each position.
+
+    For each position (column) the candidate keystream bytes are ranked once by 
+    the language model, and the session starts from the best ones. Fixing a 
+    keystream byte only re-decrypts and re-scores that column; plaintexts are 
+    only built for the rows being shown.
+    """
+    def __init__(self, ciphertexts: List[bytes], model: Union[str, LanguageModel] = 'rank') -> None:
+        self.ciphertexts = list(ciphertexts)
+        self._model = get_model(model)
+        # Rows sorted longest first, so the rows covering a position are a prefix.
+        rows = sorted(self.ciphertexts, key=len, reverse=True)
+        max_length = len(rows[0]) if rows else 0
+        self._columns = []
+        self._candidates = []
+        height = len(rows)
+        for position in range(max_length):
+            while len(rows[height - 1]) <= position:
+                height -= 1
+            column = bytes(row[position] for row in rows[:height])
+            scores = self._model.score_keys(column, range(256))
+            self._columns.append(column)
+            self._candidates.append(sorted(range(256), key=scores.__getitem__, reverse=True))
+        
+        self.keystream = bytearray(max_length)
+        self.candidate_index = [0] * max_length
+        self._plain_columns = [b''] * max_length
+        self.column_scores = [0.0] * max_length
+        for position in range(max_length):
+            self.set_key_byte(position, self._candidates[position][0])
+
+    def __len__(self) -> int:
+        return len(self.ciphertexts)
+
+    @property
+    def score(self) -> float:
+        return sum(self.column_scores)
+
+    def set_key_byte(self, position: int, key_byte: int) -> None:
+        """Fix the keystream byte at position and update only its column."""
+        if not 0 <= key_byte < 256:
+            raise ValueError('Keystream byte must be in range 0-255')
+        self.keystream[position] = key_byte
+        self.candidate_index[position] = self._candidates[position].index(key_byte)
+        self._plain_columns[position] = xor(self._columns[position], bytes([key_byte]))
+        self.column_scores[position] = self._model.score(self._plain_columns[position])
+
+    def next_candidate(self, position: int, step: int = 1) -> int:
+        """Move to the next (or, with negative step, previous) ranked candidate at position."""
+        candidates = self._candidates[position]
+        key_byte = candidates[(self.candidate_index[position] + step) % len(candidates)]
+        self.set_key_byte(position, key_byte)
+
+        return key_byte
+
+    def guess(self, row: int, offset: int, text: bytes) -> None:
+        """Fix the keystream so that the given row decrypts to text at offset."""
+        ciphertext = self.ciphertexts[row]
+        if offset < 0 or offset + len(text) > len(ciphertext):
+            raise ValueError(f'Guess does not fit in row {row} ({len(ciphertext)} bytes)')
+        for i, byte in enumerate(text):
+            self.set_key_byte(offset + i, ciphertext[offset + i] ^ byte)
+
+    def plaintext(self, row: int) -> bytes:
+        ciphertext = self.ciphertexts[row]
+        return xor(ciphertext, self.keystream[:len(ciphertext)]) if ciphertext else b''
+
+class SubstitutionShell(cmd.Cmd):
+    """Command line front end of SubstitutionSession."""
+    intro = 'Break fixed-nonce CTR by substitution. Type help or ? to list commands.'
+    prompt = '(c19) '
+    page_size = 20
+
+    def __init__(self, session: SubstitutionSession) -> None:
+        super().__init__()
+        self.session = session
+        self._start = 0
+
+    def _show_rows(self, start: int, count: int) -> None:
+        self._start = start
+        for row in range(start, min(start + count, len(self.session))):
+            text = ''.join(chr(b) if 0x20 <= b < 0x7f else '.' for b in self.session.plaintext(row))
+            print(f'{row:>5} {text}')
+
+    def do_show(self, arg: str) -> None:
+        """show [start] [count]: show decrypted rows (default: the current page)"""
+        args = [int(a) for a in arg.split()]
+        start = args[0] if args else self._start
+        count = args[1] if len(args) > 1 else self.page_size
+        self._show_rows(start, count)
+
+    def do_next(self, arg: str) -> None:
+        """next <position> [step]: try the next ranked keystream byte at position"""
+        args = [int(a) for a in arg.split()]
+        key_byte = self.session.next_candidate(args[0], args[1] if len(args) > 1 else 1)
+        print(f'keystream[{args[0]}] = {key_byte:02x}')
+        self._show_rows(self._start, self.page_size)
+
+    def do_prev(self, arg: str) -> None:
+        """prev <position>: go back to the previous ranked keystream byte at position"""
+        self.do_next(f'{arg} -1')
+
+    def do_set(self, arg: str) -> None:
+        """set <position> <hex byte>: fix the keystream byte at position"""
+        position, key_byte = arg.split()
+        self.session.set_key_byte(int(position), int(key_byte, 16))
+        self._show_rows(self._start, self.page_size)
+
+    def do_guess(self, arg: str) -> None:
+        """guess <row> <offset> <text>: fix the keystream so row decrypts to text at offset"""
+        row, offset, text = arg.split(' ', 2)
+        self.session.guess(int(row), int(offset), text.encode('latin-1'))
+        self._show_rows(self._start, self.page_size)
+
+    def do_key(self, arg: str) -> None:
+        """key: print the current keystream guess"""
+        print(self.session.keystream.hex())
+
+    def do_score(self, arg: str) -> None:
+        """score: print the total language model score"""
+        print(self.session.score)
+
+    def do_quit(self, arg: str) -> bool:
+        """quit: exit"""
+        return True
+
+    do_EOF = do_quit
+
+    def onecmd(self, line: str) -> bool:
+        try:
+            return super().onecmd(line)
+        except (ValueError, IndexError) as e:
+            print(f'Error: {e}')
+            return False
+
 if __name__ == '__main__':
-    ciphertexts = produce_ciphertexts('set_3/19.txt')
-    print(ciphertexts)
+    parser = ArgumentParser()
+    parser.add_argument('file_name', nargs='?', default='set_3/19.txt')
+    parser.add_argument('-m', '--model', default='rank', help='Language model name or file')
+
+    args = parser.parse_args()
+    ciphertexts = produce_ciphertexts(args.file_name)
     # This challenge expects us to break it manually. Guessing letters, validating guesses
+    SubstitutionShell(SubstitutionSession(ciphertexts, args.model)).cmdloop()
 
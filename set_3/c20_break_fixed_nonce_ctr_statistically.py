@@ -6,9 +6,14 @@ Break fixed-nonce CTR statistically
 -----------------------
 https://cryptopals.com/sets/3/challenges/20
 """
-from typing import List, Tuple
+import sys
+import operator
+from collections import Counter
+from typing import Iterable, List, Tuple, Union
 
+from utils.language_model import LanguageModel, get_model
 from set_3.c19_break_fixed_nonce_ctr_mode_using_substitutions import produce_ciphertexts
+from utils.xor import xor
 
 def get_single_long_concatenated_ciphertext(ciphertexts: List[bytes]) -> Tuple[bytes, int]:
     """
@@ -21,8 +26,95 @@ def get_single_long_concatenated_ciphertext(ciphertexts: List[bytes]) -> Tuple[b
 
     return concatenated, min_length
 
+def crack_repeating_key_xor(ciphertext: bytes, key_length: int, 
+        model: Union[str, LanguageModel] = 'rank') -> bytes:
+    """
+    Returns the key for the given repeating-key xored ciphertext, cracking 
+    each key byte on its own with the given language model.
+    """
+    language_model = get_model(model)
+    key = bytearray()
+    for i in range(key_length):
+        column = ciphertext[i::key_length]
+        scores = language_model.score_keys(column, range(256))
+        key.append(max(range(256), key=scores.__getitem__))
+
+    return bytes(key)
+
+
+class FixedNonceCTRBreaker:
+    """
+    Recovers the keystream shared by CTR ciphertexts encrypted under a fixed 
+    nonce, one keystream byte per position.
+
+    Every ciphertext contributes to every position it covers, so the number of 
+    bytes in a column varies with position and no keystream is thrown away. 
+    Ciphertexts are added incrementally with add(); only a histogram of 
+    (position, byte) counts is kept, never the ciphertexts themselves, and 
+    keystream() only rescores columns that received new bytes.
+    """
+    def __init__(self, model: Union[str, LanguageModel] = 'rank') -> None:
+        self._model = get_model(model)
+        # _counts[position*256 + byte] is number of ciphertexts with byte at position
+        self._counts = Counter()
+        # _length_counts[length] is number of ciphertexts of that length
+        self._length_counts = Counter()
+        self._keystream = bytearray()
+        self._no_of_changed_columns = 0
+
+    def add(self, ciphertexts: Iterable[bytes]) -> None:
+        for ciphertext in ciphertexts:
+            length = len(ciphertext)
+            # Count all the (position, byte) pairs of the ciphertext at once.
+            self._counts.update(map(operator.add, range(0, 256 * length, 256), ciphertext))
+            self._length_counts[length] += 1
+            self._no_of_changed_columns = max(self._no_of_changed_columns, length)
+
+    @property
+    def column_heights(self) -> List[int]:
+        """Number of ciphertexts covering each position."""
+        max_length = max(self._length_counts, default=0)
+        heights = [0] * max_length
+        covering = 0
+        for position in range(max_length - 1, -1, -1):
+            covering += self._length_counts.get(position + 1, 0)
+            heights[position] = covering
+        return heights
+
+    def keystream(self) -> bytes:
+        """Returns the most likely keystream for the ciphertexts added so far."""
+        heights = self.column_heights
+        self._keystream.extend(bytes(len(heights) - len(self._keystream)))
+        for position in range(self._no_of_changed_columns):
+            base = position * 256
+            histogram = [(byte, self._counts[base + byte]) for byte in range(256) 
+                         if base + byte in self._counts]
+            scores = self._model.score_histogram_keys(histogram, heights[position], range(256))
+            self._keystream[position] = max(range(256), key=scores.__getitem__)
+        self._no_of_changed_columns = 0
+
+        return bytes(self._keystream)
+
+    def decrypt(self, ciphertext: bytes) -> bytes:
+        """
+        Returns the decryption of ciphertext, as far as the keystream goes (the 
+        length of the longest ciphertext added); the rest is left out.
+        """
+        keystream = self.keystream()
+        length = min(len(ciphertext), len(keystream))
+        return xor(ciphertext[:length], keystream[:length]) if length else b''
 
 if __name__ == '__main__':
+    model = sys.argv[1] if len(sys.argv) == 2 else 'rank'
     ciphertexts = produce_ciphertexts('set_3/20.txt')
     concatenated_ciphertext, key_length = get_single_long_concatenated_ciphertext(ciphertexts)
     # Now break the concatenated ciphertext as repeating-key xor.
+    keystream = crack_repeating_key_xor(concatenated_ciphertext, key_length, model)
+    for ciphertext in ciphertexts[:3]:
+        print(xor(ciphertext[:key_length], keystream))
+
+    # Use every byte of every ciphertext instead of truncating
+    breaker = FixedNonceCTRBreaker(model)
+    breaker.add(ciphertexts)
+    for ciphertext in ciphertexts:
+        print(breaker.decrypt(ciphertext))
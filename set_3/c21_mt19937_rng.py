@@ -6,6 +6,13 @@ Implement the MT19937 Mersenne Twister RNG
 -----------------------
 https://cryptopals.com/sets/3/challenges/21
 """
+import sys
+from array import array
+from functools import lru_cache
+from typing import Iterator, List, Union
+
+# Typecode of unsigned 32-bit array items.
+WORD_TYPECODE = 'I' if array('I').itemsize == 4 else 'L'
 
 class MT19937RNG:
     """
@@ -32,9 +39,12 @@ class MT19937RNG:
         self._UPPER_MASK = ~self._LOWER_MASK & MT19937RNG.LOWER_W_BIT_MASK
 
     def seed_mt(self, seed: int) -> None:
-        """Initializes the generator from a seed"""
+        """
+        Initializes the generator from a seed; only its lowest w bits are used, 
+        as in the reference C code.
+        """
         self._index = MT19937RNG.N
-        self._MT[0] = seed
+        self._MT[0] = seed & MT19937RNG.LOWER_W_BIT_MASK
         for i in range(1, MT19937RNG.N): # loop over each element
             temp = MT19937RNG.F * (self._MT[i-1] ^ (self._MT[i-1] >> (MT19937RNG.W -2))) + i
             self._MT[i] = temp & MT19937RNG.LOWER_W_BIT_MASK
@@ -46,12 +56,7 @@ class MT19937RNG:
         Extracts a tempered value based on MT[index]
         calling twist() every n numbers
         """
-        if self._index >= MT19937RNG.N:
-            if self._index > MT19937RNG.N:
-                # Generator was never seeded
-                # Seeding with constant value; 5489 used in reference C code
-                self.seed_mt(5489)
-            self.twist()
+        self._prepare_state()
 
         y = self._MT[self._index]
         y = y ^ ((y >> MT19937RNG.U) & MT19937RNG.D)
@@ -62,17 +67,126 @@ class MT19937RNG:
         self._index += 1
         return y & MT19937RNG.LOWER_W_BIT_MASK
 
+    def extract_many(self, n: int) -> List[int]:
+        """Returns the next n random numbers; same as n calls to extract_number()."""
+        numbers = []
+        for words in self._extract_words(n):
+            numbers.extend(words)
+
+        return numbers
+
+    def fill(self, buffer: Union[bytearray, memoryview, array], byteorder: str = sys.byteorder) -> None:
+        """
+        Fills the writable buffer with the next random numbers, each one as 
+        4 bytes in the given byteorder ('big' or 'little'). The buffer length 
+        in bytes must be a multiple of 4.
+        """
+        view = memoryview(buffer).cast('B')
+        if view.readonly:
+            raise ValueError('The buffer must be writable')
+        if len(view) % 4:
+            raise ValueError('The buffer length must be a multiple of 4 bytes')
+
+        position = 0
+        for words in self._extract_words(len(view) // 4):
+            if byteorder != sys.byteorder:
+                words.byteswap()
+            view[position:position + 4*len(words)] = memoryview(words).cast('B')
+            position += 4*len(words)
+
+    def _prepare_state(self) -> None:
+        if self._index >= MT19937RNG.N:
+            if self._index > MT19937RNG.N:
+                # Generator was never seeded
+                # Seeding with constant value; 5489 used in reference C code
+                self.seed_mt(5489)
+            self.twist()
+
+    def _extract_words(self, n: int) -> Iterator[array]:
+        """Yields the next n random numbers, as arrays of up to N words."""
+        while n > 0:
+            self._prepare_state()
+            end = min(self._index + n, MT19937RNG.N)
+            count = end - self._index
+            words = unpack_words(temper_words(pack_words(self._MT[self._index:end]), count), count)
+            n -= count
+            self._index = end
+            yield words
+
     def twist(self) -> None:
-        """Generates the next n values from the series x_i"""
-        for i in range(MT19937RNG.N):
-            x = (self._MT[i] & self._UPPER_MASK) + (self._MT[(i+1) % MT19937RNG.N] & self._LOWER_MASK)
-            xA = x >> 1
-            if (x % 2) != 0:
-                xA = xA ^ MT19937RNG.A
-            self._MT[i] = self._MT[(i+MT19937RNG.M) % MT19937RNG.N] ^ xA
+        """
+        Generates the next n values from the series x_i
+
+        MT[i] only depends on values M positions ahead (not yet updated) or 
+        N - M positions behind (already updated), so each run of N - M values 
+        is computed at once with big integer operations on the packed words.
+        """
+        N, M = MT19937RNG.N, MT19937RNG.M
+        masks = _lane_masks(N - M)
+        mt = self._MT
+        for start in range(0, N, N - M):
+            end = min(start + N - M, N)
+            count = end - start
+            x = pack_words(mt[start:end])
+            # x_next holds MT[i+1] of each lane; it is MT[0] (already updated) for i = N - 1.
+            x_next = pack_words(mt[start+1:end+1] if end < N else mt[start+1:N] + mt[:1])
+            # MT[i+M], wrapping around to the updated values
+            x_m = pack_words(mt[start+M:end+M] if start + M < N else mt[start+M-N:end+M-N])
+
+            y = (x & masks['upper']) | (x_next & masks['lower'])
+            # (y >> 1) ^ (A if y is odd else 0), per lane
+            x_a = ((y >> 1) & masks['shift_1']) ^ ((y & masks['one']) * MT19937RNG.A)
+            mt[start:end] = unpack_words(x_m ^ x_a, count).tolist()
 
         self._index = 0
 
+def temper_words(y: int, count: int) -> int:
+    """
+    Returns the tempered values of the count 32-bit words packed in y (see 
+    pack_words); the tempering of extract_number() done on all words at once.
+    """
+    masks = _lane_masks(count)
+    y ^= (y >> MT19937RNG.U) & masks['temper_u']
+    y ^= (y << MT19937RNG.S) & masks['temper_s']
+    y ^= (y << MT19937RNG.T) & masks['temper_t']
+    y ^= (y >> MT19937RNG.L) & masks['temper_l']
+
+    return y
+
+def pack_words(words: List[int]) -> int:
+    """
+    Returns the 32-bit words packed in a single integer, each word in its own 
+    32-bit lane, so that lane-wise operations work on all words at once.
+    """
+    return int.from_bytes(array(WORD_TYPECODE, words).tobytes(), sys.byteorder)
+
+def unpack_words(y: int, count: int) -> array:
+    """Returns the count 32-bit words packed in y (see pack_words)."""
+    words = array(WORD_TYPECODE)
+    words.frombytes(y.to_bytes(4 * count, sys.byteorder))
+    return words
+
+@lru_cache(maxsize=None)
+def _lane_masks(count: int) -> dict:
+    """
+    Masks, repeated in each of count 32-bit lanes, keeping shifted bits in their 
+    own lane.
+    """
+    def repeat(mask: int) -> int:
+        return pack_words([mask & MT19937RNG.LOWER_W_BIT_MASK] * count)
+
+    lower_mask = (1 << MT19937RNG.R) - 1
+    return {
+        'upper': repeat(~lower_mask),
+        'lower': repeat(lower_mask),
+        'one': repeat(1),
+        'shift_1': repeat(MT19937RNG.LOWER_W_BIT_MASK >> 1),
+        'temper_u': repeat((MT19937RNG.LOWER_W_BIT_MASK >> MT19937RNG.U) & MT19937RNG.D),
+        'temper_s': repeat((MT19937RNG.LOWER_W_BIT_MASK << MT19937RNG.S) & MT19937RNG.B),
+        'temper_t': repeat((MT19937RNG.LOWER_W_BIT_MASK << MT19937RNG.T) & MT19937RNG.C),
+        'temper_l': repeat(MT19937RNG.LOWER_W_BIT_MASK >> MT19937RNG.L),
+    }
+
 if __name__ == '__main__':
     mersenne_twister = MT19937RNG()
     mersenne_twister.seed_mt(1624457671)
@@ -6,11 +6,21 @@ Crack an MT19937 seed
 -----------------------
 https://cryptopals.com/sets/3/challenges/22
 """
+import sys
 import time
 import random
+from argparse import ArgumentParser
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
 
 from set_3.c21_mt19937_rng import MT19937RNG
 
+# Number of candidate seeds checked at once.
+BATCH_SIZE = 4096
+SEED_SPACE = 2 ** MT19937RNG.W
+
 def get_random_number() -> int:
     # Wait a random number of seconds between, say, 40 and 1000
     # time.sleep(random.randint(40, 1000))
@@ -31,27 +41,163 @@ def get_random_number() -> int:
 
     return mersenne_twister.extract_number()
 
-def crack_seed(random_number: int) -> int:
-    # current_timestamp = int(time.time())
-    global current_timestamp
-    cracked_seed = current_timestamp
+def _repeat(word: int, count: int) -> int:
+    return int.from_bytes(array('Q', [word]) * count, sys.byteorder)
 
-    while True:
-        rng = MT19937RNG()
-        rng.seed_mt(cracked_seed)
-        if rng.extract_number() == random_number:
-            break
-        cracked_seed -= 1
+def first_outputs(start: int, stop: int) -> array:
+    """
+    Returns the first extract_number() output of MT19937RNG seeded with each 
+    seed in range(start, stop); see nth_outputs.
+    """
+    return nth_outputs(start, stop, 0)
+
+def nth_outputs(start: int, stop: int, n: int) -> array:
+    """
+    Returns the n-th (from 0) extract_number() output of MT19937RNG seeded with 
+    each seed in range(start, stop).
+
+    The seeds are packed in 64-bit lanes of one big integer, wide enough for 
+    the products of the seeding recurrence, and all of them are stepped at once. 
+    Only the state words the output depends on are computed: for n < N - M, 
+    MT[n], MT[n+1] and MT[n+M] before the first twist, i.e. the first n + M 
+    steps of seed_mt.
+    """
+    if not 0 <= start <= stop <= SEED_SPACE:
+        raise ValueError(f'The seeds must be within [0, {SEED_SPACE})')
+    N, M = MT19937RNG.N, MT19937RNG.M
+    count = stop - start
+    lower_w_bits = _repeat(MT19937RNG.LOWER_W_BIT_MASK, count)
+    ones = _repeat(1, count)
+    top_bits = _repeat(MT19937RNG.LOWER_W_BIT_MASK >> (MT19937RNG.W - 2), count)
+    lower_mask = (1 << MT19937RNG.R) - 1
+    upper_bits = _repeat(~lower_mask & MT19937RNG.LOWER_W_BIT_MASK, count)
+    lower_bits = _repeat(lower_mask, count)
+    shift_1_bits = _repeat(MT19937RNG.LOWER_W_BIT_MASK >> 1, count)
+
+    twists, index = divmod(n, N)
+    # Only one word of the last twist is needed, unless it depends on words of the same twist.
+    single_word = index < N - M
+    if twists == 0 and single_word:
+        seeded, keep = index + M + 1, {index, index + 1, index + M}
+    else:
+        seeded, keep = N, range(N)
+
+    mt = {}
+    word = int.from_bytes(array('Q', range(start, stop)), sys.byteorder)
+    for i in range(seeded):
+        if i:
+            word = ((word ^ ((word >> (MT19937RNG.W - 2)) & top_bits)) * MT19937RNG.F + ones * i) & lower_w_bits
+        if i in keep:
+            mt[i] = word
+
+    for twist in range(twists + 1):
+        last_twist = twist == twists
+        for i in ([index] if last_twist and single_word else range(index + 1 if last_twist else N)):
+            x = (mt[i] & upper_bits) | (mt[(i + 1) % N] & lower_bits)
+            mt[i] = mt[(i + M) % N] ^ ((x >> 1) & shift_1_bits) ^ ((x & ones) * MT19937RNG.A)
+
+    # Tempering; the masks keep the shifted bits in their own lane.
+    y = mt[index]
+    y ^= (y >> MT19937RNG.U) & _repeat(MT19937RNG.D >> MT19937RNG.U, count)
+    y ^= (y << MT19937RNG.S) & _repeat(MT19937RNG.B, count)
+    y ^= (y << MT19937RNG.T) & _repeat(MT19937RNG.C, count)
+    y ^= (y >> MT19937RNG.L) & _repeat(MT19937RNG.LOWER_W_BIT_MASK >> MT19937RNG.L, count)
 
-    return cracked_seed
+    outputs = array('Q')
+    outputs.frombytes(y.to_bytes(8 * count, sys.byteorder))
+    return outputs
+
+def search_seeds(random_number: int, start: int, stop: int) -> List[int]:
+    """Returns the seeds in range(start, stop) whose first output is random_number."""
+    seeds = []
+    for batch_start in range(start, stop, BATCH_SIZE):
+        outputs = first_outputs(batch_start, min(batch_start + BATCH_SIZE, stop))
+        if random_number in outputs:
+            seeds.extend(batch_start + i for i, output in enumerate(outputs) if output == random_number)
+
+    return seeds
+
+def _search_rounds(timestamp: int, window: Optional[int], round_size: int) -> Iterator[List[Tuple[int, int]]]:
+    """
+    Yields the seed ranges of each round, searching backward and forward from 
+    timestamp; round k covers the seeds at distance [k*round_size, (k+1)*round_size).
+    """
+    low = 0 if window is None else max(timestamp - window, 0)
+    high = SEED_SPACE if window is None else min(timestamp + window + 1, SEED_SPACE)
+    distance = 0
+    while timestamp - distance > low or timestamp + distance < high:
+        backward = (max(timestamp - distance - round_size, low), max(timestamp - distance, low))
+        forward = (min(timestamp + distance, high), min(timestamp + distance + round_size, high))
+        yield [(start, stop) for start, stop in (backward, forward) if start < stop]
+        distance += round_size
+
+def crack_seed(random_number: int, timestamp: int = None, window: Optional[int] = 24 * 3600,
+        workers: int = 1) -> Optional[int]:
+    """
+    Returns the seed closest to timestamp (default: now), at most window seconds 
+    before or after it, whose first output is random_number; None if no seed matches.
+
+    window=None searches the whole 32-bit seed space. The backward and forward 
+    windows are searched together, in rounds of growing distance from timestamp; 
+    with workers > 1 the rounds are searched on a pool of worker processes, 
+    with only a few rounds in flight, and the search stops at the first round 
+    with a match.
+    """
+    if timestamp is None:
+        timestamp = int(time.time())
+    if workers == 1:
+        for seed_ranges in _search_rounds(timestamp, window, BATCH_SIZE):
+            seeds = [seed for start, stop in seed_ranges for seed in search_seeds(random_number, start, stop)]
+            if seeds:
+                return min(seeds, key=lambda seed: abs(seed - timestamp))
+        return None
+
+    round_size = BATCH_SIZE * 16
+    rounds = _search_rounds(timestamp, window, round_size)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+        try:
+            while True:
+                while len(in_flight) < 2 * workers:
+                    seed_ranges = next(rounds, None)
+                    if seed_ranges is None:
+                        break
+                    in_flight.append([executor.submit(search_seeds, random_number, start, stop)
+                                      for start, stop in seed_ranges])
+                if not in_flight:
+                    return None
+                seeds = [seed for future in in_flight.popleft() for seed in future.result()]
+                if seeds:
+                    return min(seeds, key=lambda seed: abs(seed - timestamp))
+        finally:
+            for futures in in_flight:
+                for future in futures:
+                    future.cancel()
 
 if __name__ == '__main__':
-    random_number = get_random_number()
+    parser = ArgumentParser()
+    parser.add_argument('random_number', type=int, nargs='?', 
+                        help='First output to crack (default: output of a freshly seeded generator)')
+    parser.add_argument('-t', '--timestamp', type=int, help='Search around this time (default: now)')
+    parser.add_argument('-W', '--window', type=int, default=24 * 3600, 
+                        help='Search seconds before and after the timestamp')
+    parser.add_argument('-f', '--full', action='store_true', help='Search the whole 32-bit seed space')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='Number of worker processes')
+    args = parser.parse_args()
+
+    random_number = args.random_number
+    timestamp = args.timestamp
+    if random_number is None:
+        random_number = get_random_number()
+        # Simulated current time
+        timestamp = current_timestamp
     print(f'First RNG output: {random_number}')
 
-    cracked_seed = crack_seed(random_number)
-    print(f'Cracked seed: {cracked_seed}')
+    start_time = time.perf_counter()
+    cracked_seed = crack_seed(random_number, timestamp, None if args.full else args.window, args.workers)
+    print(f'Cracked seed: {cracked_seed} ({time.perf_counter() - start_time:.2f}s)')
 
-    rng = MT19937RNG()
-    rng.seed_mt(cracked_seed)
-    assert random_number == rng.extract_number(), "Test Failed!"
+    if cracked_seed is not None:
+        rng = MT19937RNG()
+        rng.seed_mt(cracked_seed)
+        assert random_number == rng.extract_number(), "Test Failed!"
@@ -6,15 +6,17 @@ Clone an MT19937 RNG from its output
 -----------------------
 https://cryptopals.com/sets/3/challenges/23
 """
-from typing import List
+from functools import lru_cache
+from itertools import islice
+from typing import Iterable, List, Sequence
 
-from set_3.c21_mt19937_rng import MT19937RNG
+from set_3.c21_mt19937_rng import MT19937RNG, pack_words, unpack_words
 
 def get_batch_output(mt_rng: MT19937RNG) -> List[int]:
-    return [mt_rng.extract_number() for _ in range(MT19937RNG.N)]
+    return mt_rng.extract_many(MT19937RNG.N)
 
-def get_mt_state_from_batch_output(batch_output: List[int]) -> List[int]:
-    return [untemper(random_number) for random_number in batch_output]
+def get_mt_state_from_batch_output(batch_output: Sequence[int]) -> List[int]:
+    return untemper_many(batch_output)
 
 def untemper(random_number: int) -> int:
     """
@@ -33,7 +35,39 @@ def untemper(random_number: int) -> int:
     y = reverse_right(y, MT19937RNG.U, MT19937RNG.D)
 
     return y
-        
+
+def untemper_many(random_numbers: Sequence[int]) -> List[int]:
+    """
+    Returns untemper() of each random number; all of them are untempered at 
+    once, packed in the lanes of one big integer (see c21.pack_words).
+    """
+    count = len(random_numbers)
+    masks = _untemper_masks(count)
+    y = pack_words(random_numbers)
+    y = _reverse_shift(y, -MT19937RNG.L, masks['l'])
+    y = _reverse_shift(y, MT19937RNG.T, masks['t'])
+    y = _reverse_shift(y, MT19937RNG.S, masks['s'])
+    y = _reverse_shift(y, -MT19937RNG.U, masks['u'])
+
+    return unpack_words(y, count).tolist()
+
+def _reverse_shift(y: int, shift: int, lane_mask: int) -> int:
+    """
+    For unknown ym1 in: y = ym1 ^ ((ym1 << shift) & magic_number), or
+    y = ym1 ^ ((ym1 >> -shift) & magic_number) for negative shift, 
+    returns ym1. lane_mask is magic_number without the bits that the shift 
+    moves out of their (32-bit) lane.
+
+    ym1 is the fixed point of ym1 = y ^ shifted(ym1): starting from y, 
+    every iteration gets shift more bits of ym1 right, so it takes 
+    ceil(W / shift) iterations.
+    """
+    ym1 = y
+    for _ in range(-(-MT19937RNG.W // abs(shift)) - 1):
+        ym1 = y ^ (((ym1 << shift) if shift > 0 else (ym1 >> -shift)) & lane_mask)
+
+    return ym1
+
 def reverse_right(y: int, shift: int, magic_number: int) -> int:
     """
     Reverse the right shift operation.
@@ -41,23 +75,7 @@ def reverse_right(y: int, shift: int, magic_number: int) -> int:
     For unknown ym1 in: y = ym1 ^ ((ym1 >> shift) & magic_number) 
     Returns: ym1 = ?
     """
-    ym1 = 0
-    # Divide the number's bits into blocks of length equal to shift
-    # Counting the blocks from msb to lsb
-    for i in range(MT19937RNG.W//shift):
-        y_ith_block = (y >> (MT19937RNG.W - (i+1)*shift)) & (2 ** shift - 1)
-        magic_number_ith_block = (magic_number >> (MT19937RNG.W - (i+1)*shift)) & (2 ** shift - 1)
-        ym1_ith_block = y_ith_block ^ (ym1 & magic_number_ith_block)
-        ym1 = (ym1 << shift) ^ ym1_ith_block
-
-    remaining_bits = MT19937RNG.W % shift
-    if remaining_bits:
-        y_remaining = y & (2 ** remaining_bits - 1)
-        magic_number_remaining = magic_number & (2 ** remaining_bits - 1)
-        ym1_remaining = y_remaining ^ ((ym1 >> (shift - remaining_bits)) & magic_number_remaining)
-        ym1 = (ym1 << remaining_bits) ^ ym1_remaining
-
-    return ym1
+    return _reverse_shift(y, -shift, magic_number)
 
 def reverse_left(y: int, shift: int, magic_number: int) -> int:
     """
@@ -66,24 +84,20 @@ def reverse_left(y: int, shift: int, magic_number: int) -> int:
     For unknown ym1 in: y = ym1 ^ ((ym1 << shift) & magic_number)
     Returns: ym1 = ?
     """
-    ym1 = 0
-    # Divide the number's bits into blocks of length equal to shift
-    # Counting the blocks from lsb to msb
-    for i in range(MT19937RNG.W//shift):
-        y_ith_block = (y >> i*shift) & (2 ** shift - 1)
-        magic_number_ith_block = (magic_number >> i*shift) & (2 ** shift - 1)
-        ym1_i_minus_1th_block = ((ym1 >> (i-1)*shift) & (2 ** shift - 1)) if i > 0 else ym1
-        ym1_ith_block = y_ith_block ^ (ym1_i_minus_1th_block & magic_number_ith_block)
-        ym1 = (ym1_ith_block << i * shift) ^ ym1
-    
-    remaining_bits = MT19937RNG.W % shift
-    if remaining_bits:
-        y_remaining = (y >> (MT19937RNG.W - remaining_bits)) & (2 ** remaining_bits - 1)
-        magic_number_remaining = (magic_number >> (MT19937RNG.W - remaining_bits)) & (2 ** remaining_bits - 1)
-        ym1_remaining = y_remaining ^ (((ym1 >> (MT19937RNG.W - remaining_bits - shift)) & (2 ** remaining_bits - 1)) & magic_number_remaining)
-        ym1 = (ym1_remaining << (MT19937RNG.W - remaining_bits)) ^ ym1
-    
-    return ym1
+    return _reverse_shift(y, shift, magic_number & MT19937RNG.LOWER_W_BIT_MASK)
+
+@lru_cache(maxsize=None)
+def _untemper_masks(count: int) -> dict:
+    def repeat(mask: int) -> int:
+        return pack_words([mask & MT19937RNG.LOWER_W_BIT_MASK] * count)
+
+    word_mask = MT19937RNG.LOWER_W_BIT_MASK
+    return {
+        'l': repeat(word_mask >> MT19937RNG.L),
+        't': repeat((word_mask << MT19937RNG.T) & MT19937RNG.C),
+        's': repeat((word_mask << MT19937RNG.S) & MT19937RNG.B),
+        'u': repeat((word_mask >> MT19937RNG.U) & MT19937RNG.D),
+    }
 
 def clone_rng_from_state(state: List[int]) -> MT19937RNG:
     cloned_mt_rng = MT19937RNG()
@@ -93,6 +107,30 @@ def clone_rng_from_state(state: List[int]) -> MT19937RNG:
 
     return cloned_mt_rng
 
+def clone_rng_from_stream(random_numbers: Iterable[int], check: int = 0) -> MT19937RNG:
+    """
+    Returns a clone of the generator that produced random_numbers, taking N 
+    consecutive outputs starting at any offset in its output stream, e.g. from 
+    a live feed. The clone continues after the N outputs taken.
+
+    The state words x_k (the untempered outputs) follow the same recurrence 
+    x_{k+N} = x_{k+M} ^ twist(x_k, x_{k+1}) whatever the position of k in a 
+    batch of N, so any N consecutive words can serve as the state of the clone, 
+    which then resynchronizes on its own batch boundary. The next check 
+    outputs are then taken and compared with those of the clone.
+    """
+    random_numbers = iter(random_numbers)
+    batch_output = list(islice(random_numbers, MT19937RNG.N))
+    if len(batch_output) < MT19937RNG.N:
+        raise ValueError(f'At least {MT19937RNG.N} outputs are needed to clone the generator')
+    cloned_mt_rng = clone_rng_from_state(untemper_many(batch_output))
+
+    checked_outputs = list(islice(random_numbers, check))
+    if checked_outputs != cloned_mt_rng.extract_many(len(checked_outputs)):
+        raise ValueError('The outputs are not consecutive outputs of an MT19937 generator')
+
+    return cloned_mt_rng
+
 if __name__ == '__main__':
     mt_rng = MT19937RNG()
     batch_output = get_batch_output(mt_rng)
@@ -106,3 +144,10 @@ if __name__ == '__main__':
         cloned_random_number = cloned_mt_rng.extract_number()
         assert(random_number == cloned_random_number)
         print(f'Random: {random_number}; Cloned: {cloned_random_number}')
+
+    # Clone from the middle of a batch
+    offset = 1000
+    mt_rng.extract_many(offset)
+    stream = iter(mt_rng.extract_many(MT19937RNG.N + 20))
+    cloned_mt_rng = clone_rng_from_stream(stream, check=20)
+    assert mt_rng.extract_many(1000) == cloned_mt_rng.extract_many(1000), 'Test Failed!'
@@ -10,42 +10,61 @@ import os
 import random
 import string
 import time
+import multiprocessing
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Optional, Tuple
 
+from utils.xor import xor
 from set_3.c21_mt19937_rng import MT19937RNG
+from set_3.c22_crack_mt19937_seed import BATCH_SIZE, nth_outputs
+
+# Set in worker processes of crack_key once any worker found the key
+_stop_event = None
 
 class MT19937StreamCipher:
+    """
+    Stream cipher xoring the text with the outputs of MT19937RNG seeded with 
+    the key, each output giving 4 keystream bytes (big-endian).
+
+    encrypt(), decrypt() and update() continue the same keystream, so a long 
+    text can be processed in pieces.
+    """
     def __init__(self, key: bytes) -> None:
         self._key = key
         self._rng = MT19937RNG()
         self._rng.seed_mt(int.from_bytes(self._key, 'big'))
-
-    def _keystream_generator(self) -> int:
-        while True:
-            random_number = self._rng.extract_number()
-            for i in range(MT19937RNG.W//8):
-                yield (random_number >> (MT19937RNG.W - (i+1) * 8)) & 0xff
+        # Keystream bytes left over from the last output used
+        self._keystream_left = b''
+
+    def _keystream(self, length: int) -> bytes:
+        """Returns the next length keystream bytes."""
+        keystream = self._keystream_left[:length]
+        if len(keystream) < length:
+            # Whole outputs are taken from the generator at once, in big-endian order.
+            buffer = bytearray(-(-(length - len(keystream)) // 4) * 4)
+            self._rng.fill(buffer, 'big')
+            keystream += buffer
+        self._keystream_left = keystream[length:]
+
+        return keystream[:length]
+
+    def update(self, text: bytes) -> bytes:
+        """Returns the next piece of the encrypted (or decrypted) text."""
+        return xor(text, self._keystream(len(text))) if text else b''
                 
     def encrypt(self, plaintext: bytes) -> bytes:
-        return self._encrypt_decrypt(plaintext)
+        return self.update(plaintext)
 
     def decrypt(self, ciphertext: bytes) -> bytes:
-        return self._encrypt_decrypt(ciphertext)
-
-    def _encrypt_decrypt(self, text: bytes) -> bytes:
-        keystream = self._keystream_generator()
-        xor_text = b''
-        for byte in text:
-            xor_bytes = byte ^ next(keystream)
-            xor_text += bytes([xor_bytes])
+        return self.update(ciphertext)
 
-        return xor_text
-
-def get_ciphertext(message: bytes) -> bytes:
+def get_ciphertext(message: bytes, key_size: int = 2) -> bytes:
     """
     Returns ciphertext by encrypting message prefexed with random 
     number of random characters, using MT19937 stream cipher.
     """
-    key = os.urandom(2) # 16-bits
+    key = os.urandom(key_size) # 16-bits by default
     
     # For testing
     global KEY_LOG
@@ -59,17 +78,89 @@ def get_ciphertext(message: bytes) -> bytes:
 
     return ciphertext
 
-def crack_key(ciphertext: bytes, message: bytes) -> bytes:
+def _known_keystream_word(ciphertext: bytes, message: bytes) -> Tuple[int, int, int]:
+    """
+    Returns (n, mask, word): the index n of the generator output, among those 
+    covering the known message at the end of ciphertext, with the most known 
+    keystream bytes, the mask of those bytes and their value.
+    """
+    message_start = len(ciphertext) - len(message)
+    known_keystream = xor(ciphertext[message_start:], message)
+    best = None
+    for n in range(message_start // 4, (len(ciphertext) - 1) // 4 + 1):
+        mask = word = 0
+        for position in range(4*n, 4*n + 4):
+            mask, word = mask << 8, word << 8
+            if message_start <= position < len(ciphertext):
+                mask |= 0xff
+                word |= known_keystream[position - message_start]
+        if best is None or bin(mask).count('1') > bin(best[1]).count('1'):
+            best = (n, mask, word)
+
+    return best
+
+def _init_worker(stop_event) -> None:
+    global _stop_event
+    _stop_event = stop_event
+
+def _search_keys(start: int, stop: int, ciphertext: bytes, message: bytes, key_size: int,
+        keystream_word: Tuple[int, int, int]) -> Optional[bytes]:
+    """
+    Returns the key in range(start, stop) decrypting ciphertext to a text ending 
+    with message, if any. Only keys whose n-th generator output matches word on 
+    the mask bits (see _known_keystream_word) are decrypted. Stops early once the 
+    stop event is set, and sets it when the key is found.
+    """
+    n, mask, word = keystream_word
+    for batch_start in range(start, stop, BATCH_SIZE):
+        if _stop_event is not None and _stop_event.is_set():
+            break
+        outputs = nth_outputs(batch_start, min(batch_start + BATCH_SIZE, stop), n)
+        if mask == MT19937RNG.LOWER_W_BIT_MASK and word not in outputs:
+            continue
+        for i, output in enumerate(outputs):
+            if output & mask != word:
+                continue
+            key = int.to_bytes(batch_start + i, key_size, 'big')
+            if MT19937StreamCipher(key).decrypt(ciphertext).endswith(message):
+                if _stop_event is not None:
+                    _stop_event.set()
+                return key
+
+    return None
+
+def crack_key(ciphertext: bytes, message: bytes, key_size: int = 2, workers: int = 1) -> Optional[bytes]:
     """
     Returns cracked key using ciphertext and known message.
+
+    Keys are tried key_size (1 to 4) bytes long (16 bits by default; too short, so 
+    brute force works). For each key only the generator output covering most of the 
+    known message is computed (see c22.nth_outputs), for many keys at once, and 
+    only the keys it matches are checked by decrypting. With workers > 1 the 
+    key space is split across a pool of worker processes, which all stop as 
+    soon as any of them finds the key.
     """
-    # Key size is just 16 bits (too short). So, simple brute force works
-    for i in range(2**16):
-        key = int.to_bytes(i, 2,'big')
-        stream_cipher = MT19937StreamCipher(key)
-        plaintext = stream_cipher.decrypt(ciphertext)
-        if plaintext.endswith(message):
-            return key
+    if not 1 <= key_size <= MT19937RNG.W // 8:
+        raise ValueError(f'The key size must be 1 to {MT19937RNG.W // 8} bytes, to fit a seed')
+    if not message or len(message) > len(ciphertext):
+        raise ValueError('The known message must be a non-empty suffix of the ciphertext')
+    keystream_word = _known_keystream_word(ciphertext, message)
+    key_space = 2 ** (8 * key_size)
+    if workers == 1:
+        return _search_keys(0, key_space, ciphertext, message, key_size, keystream_word)
+
+    range_size = -(-key_space // workers)
+    stop_event = multiprocessing.Manager().Event()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(stop_event,)) as executor:
+        futures = [executor.submit(_search_keys, start, min(start + range_size, key_space), ciphertext, message,
+                                   key_size, keystream_word)
+                   for start in range(0, key_space, range_size)]
+        for future in as_completed(futures):
+            key = future.result()
+            if key is not None:
+                return key
+
+    return None
 
 def generate_passowrd_reset_token() -> str:
     timestamp = int(time.time())
@@ -90,16 +181,26 @@ def check_reset_token(token: str) -> bool:
     return False
 
 if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('-k', '--key-size', type=int, default=2, help='Key size in bytes (e.g. 3 for 24-bit keys)')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='Number of worker processes')
+    args = parser.parse_args()
+
     # Test if cipher is working properly
     stream_cipher = MT19937StreamCipher(b'aa')
     plaintext = b'A'*12
     ciphertext = stream_cipher.encrypt(plaintext)
     assert plaintext == MT19937StreamCipher(b'aa').decrypt(ciphertext)
+    # Streaming in pieces gives the same ciphertext
+    stream_cipher = MT19937StreamCipher(b'aa')
+    assert ciphertext == b''.join(stream_cipher.update(plaintext[i:i+5]) for i in range(0, len(plaintext), 5))
 
     # Crack key
     message = b'A'*14
-    ciphertext = get_ciphertext(message)
-    key = crack_key(ciphertext, message)
+    ciphertext = get_ciphertext(message, args.key_size)
+    start_time = time.perf_counter()
+    key = crack_key(ciphertext, message, args.key_size, args.workers)
+    print(f'Cracked {8 * args.key_size}-bit key: {key.hex()} ({time.perf_counter() - start_time:.2f}s)')
     assert key == KEY_LOG
     
     # Generate and test token
@@ -0,0 +1,205 @@
+"""
+
+Index from first MT19937 output to seed
+---------------------------------------
+Turns the first extract_number() output of a generator seeded with, say, a 
+recent Unix timestamp back into its seed with a binary search, instead of 
+brute forcing seeds:
+
+python -m set_3.mt19937_seed_index build <index_file> [--years N | --start S --stop E] [-w workers]
+python -m set_3.mt19937_seed_index lookup <index_file> <output>
+
+The index file holds a small header followed by the sorted uint64 records 
+output << 32 | seed (native byte order), and is memory-mapped for lookups. 
+It is built in chunks which are sorted and saved on their own, so an 
+interrupted build resumes from the chunks already done, and then merged. 
+Running build again without --start/--stop resumes the interrupted build.
+
+"""
+import os
+import sys
+import mmap
+import time
+import heapq
+import shutil
+import struct
+from argparse import ArgumentParser
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+from set_3.c21_mt19937_rng import MT19937RNG
+from set_3.c22_crack_mt19937_seed import SEED_SPACE, first_outputs
+
+MAGIC = b'MTSI'
+# Magic, first seed, seed after the last, padded to a multiple of the record size
+HEADER = struct.Struct('<4sQQ4x')
+# Magic, first seed, seed after the last, chunk size of an index build
+BUILD_PARAMETERS = struct.Struct('<4sQQQ')
+BUILD_PARAMETERS_FILE = 'build_parameters'
+CHUNK_SIZE = 1 << 21
+# Records written to the index file at a time while merging
+WRITE_BATCH = 1 << 16
+
+def _build_chunk(start: int, stop: int, file_name: str) -> None:
+    """Saves the sorted records of the seeds in range(start, stop) to file_name."""
+    outputs = first_outputs(start, stop)
+    records = array('Q', sorted(output << 32 | seed for seed, output in zip(range(start, stop), outputs)))
+    with open(file_name + '.tmp', 'wb') as f:
+        records.tofile(f)
+    # Only complete chunks get their final name.
+    os.replace(file_name + '.tmp', file_name)
+
+def _read_records(file_name: str) -> Iterator[int]:
+    with open(file_name, 'rb') as f:
+        while True:
+            records = array('Q')
+            records.frombytes(f.read(8 * WRITE_BATCH))
+            if not records:
+                return
+            yield from records
+
+def saved_build_parameters(file_name: str) -> Optional[Tuple[int, int, int]]:
+    """
+    Returns (start, stop, chunk_size) of the interrupted build of the index 
+    file_name, or None if there is none to resume.
+    """
+    try:
+        with open(os.path.join(file_name + '.chunks', BUILD_PARAMETERS_FILE), 'rb') as f:
+            magic, start, stop, chunk_size = BUILD_PARAMETERS.unpack(f.read())
+    except (OSError, struct.error):
+        return None
+
+    return (start, stop, chunk_size) if magic == MAGIC else None
+
+def build_index(file_name: str, start: int, stop: int, chunk_size: int = CHUNK_SIZE,
+        workers: int = 1, progress: bool = False) -> None:
+    """
+    Builds the index of the seeds in range(start, stop) into file_name.
+
+    The sorted chunks are kept in the directory file_name + '.chunks' until 
+    the merged index is complete, and the chunks already there are not built 
+    again. Resuming a build with a different range or chunk size is refused.
+    """
+    if not 0 <= start < stop <= SEED_SPACE:
+        raise ValueError(f'The seed range must be within [0, {SEED_SPACE})')
+    if chunk_size < 1:
+        raise ValueError('The chunk size must be positive')
+    chunks_dir = file_name + '.chunks'
+    parameters_file = os.path.join(chunks_dir, BUILD_PARAMETERS_FILE)
+    saved_parameters = saved_build_parameters(file_name)
+    if saved_parameters is None:
+        if os.path.isdir(chunks_dir) and os.listdir(chunks_dir):
+            raise ValueError(f'{chunks_dir} holds chunks of an unknown build; remove it to start over')
+        os.makedirs(chunks_dir, exist_ok=True)
+        with open(parameters_file, 'wb') as f:
+            f.write(BUILD_PARAMETERS.pack(MAGIC, start, stop, chunk_size))
+    elif saved_parameters != (start, stop, chunk_size):
+        saved_start, saved_stop, saved_chunk_size = saved_parameters
+        raise ValueError(f'{chunks_dir} holds a build of seeds [{saved_start}, {saved_stop}) with chunk size '
+                         f'{saved_chunk_size}; resume it with the same parameters or remove it to start over')
+
+    chunks = [(chunk_start, chunk_stop, os.path.join(chunks_dir, f'{chunk_start:010d}-{chunk_stop:010d}.bin'))
+              for chunk_start in range(start, stop, chunk_size)
+              for chunk_stop in [min(chunk_start + chunk_size, stop)]]
+    # Chunks are complete once saved, but check anyway that none got truncated.
+    missing = [(chunk_start, chunk_stop, chunk_file) for chunk_start, chunk_stop, chunk_file in chunks
+               if not os.path.isfile(chunk_file) or os.path.getsize(chunk_file) != 8 * (chunk_stop - chunk_start)]
+
+    start_time = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for done, _ in enumerate(executor.map(_build_chunk, *zip(*missing)) if missing else (), 1):
+            if progress:
+                elapsed = time.perf_counter() - start_time
+                print(f'{len(chunks) - len(missing) + done}/{len(chunks)} chunks; {elapsed:.0f}s', file=sys.stderr)
+
+    with open(file_name + '.tmp', 'wb') as f:
+        f.write(HEADER.pack(MAGIC, start, stop))
+        records = array('Q')
+        for record in heapq.merge(*(_read_records(chunk[2]) for chunk in chunks)):
+            records.append(record)
+            if len(records) == WRITE_BATCH:
+                records.tofile(f)
+                records = array('Q')
+        records.tofile(f)
+    # Raises ValueError, keeping the chunks, if the merged index is not valid.
+    SeedIndex(file_name + '.tmp').close()
+    os.replace(file_name + '.tmp', file_name)
+    shutil.rmtree(chunks_dir)
+
+class SeedIndex:
+    """Memory-mapped index file; lookup(output) returns the seeds with that first output."""
+    def __init__(self, file_name: str) -> None:
+        self._file = open(file_name, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, self.start, self.stop = HEADER.unpack(self._mmap[:HEADER.size])
+            if magic != MAGIC or len(self._mmap) != HEADER.size + 8 * (self.stop - self.start):
+                raise ValueError(f'{file_name} is not a valid seed index file')
+        except ValueError:
+            self._file.close()
+            raise
+        self._records = memoryview(self._mmap)[HEADER.size:].cast('Q')
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __enter__(self) -> 'SeedIndex':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._records.release()
+        self._mmap.close()
+        self._file.close()
+
+    def lookup(self, output: int) -> List[int]:
+        """Returns the seeds, in increasing order, whose first output is output."""
+        records = self._records
+        seeds = []
+        i = bisect_left(records, output << 32)
+        while i < len(records) and records[i] >> 32 == output:
+            seeds.append(records[i] & 0xFFFFFFFF)
+            i += 1
+
+        return seeds
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Build or query an index from first MT19937 output to seed')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build')
+    build.add_argument('index_file')
+    build.add_argument('-y', '--years', type=float, default=1.0, help='Index the timestamps of the last years')
+    build.add_argument('-s', '--start', type=int, help='First seed (overrides --years)')
+    build.add_argument('-e', '--stop', type=int, help='Seed after the last (default: now + 1)')
+    build.add_argument('-c', '--chunk-size', type=int, default=CHUNK_SIZE, help='Seeds per chunk')
+    build.add_argument('-w', '--workers', type=int, default=1, help='Number of worker processes')
+    lookup = commands.add_parser('lookup')
+    lookup.add_argument('index_file')
+    lookup.add_argument('output', type=int)
+
+    args = parser.parse_args()
+    if args.command == 'build':
+        saved_parameters = saved_build_parameters(args.index_file)
+        if saved_parameters is not None and args.start is None and args.stop is None:
+            # Resume the interrupted build rather than indexing up to the new current time.
+            start, stop, chunk_size = saved_parameters
+            print(f'Resuming build of seeds [{start}, {stop}) with chunk size {chunk_size}', file=sys.stderr)
+        else:
+            stop = int(time.time()) + 1 if args.stop is None else args.stop
+            start = stop - int(args.years * 365 * 24 * 3600) if args.start is None else args.start
+            start, chunk_size = max(start, 0), args.chunk_size
+        build_index(args.index_file, start, stop, chunk_size, args.workers, progress=True)
+    else:
+        with SeedIndex(args.index_file) as index:
+            start_time = time.perf_counter()
+            seeds = index.lookup(args.output)
+            elapsed = time.perf_counter() - start_time
+        for seed in seeds:
+            rng = MT19937RNG()
+            rng.seed_mt(seed)
+            assert rng.extract_number() == args.output, 'Test Failed!'
+        print(f'Seeds: {seeds} ({elapsed * 1e6:.0f} us)')
@@ -2,6 +2,7 @@ import os
 import base64
 
 from utils.aes import AES, Mode
+from utils.ctr_file import CTRFile
 from utils.xor import xor
 
 KEY = os.urandom(16)
@@ -11,10 +12,10 @@ def edit_api(ciphertext: bytes, offset: int, newtext: bytes) -> bytes:
     return _edit_ciphertext(ciphertext, KEY, offset, newtext)
 
 def _edit_ciphertext(ciphertext: bytes, key: bytes, offset: int, newtext: bytes) -> bytes:
-    cipher = AES(Mode.CTR)
-    plaintext = cipher.decrypt(ciphertext, key)
-    new_plaintext = plaintext[:offset] + newtext + plaintext[offset + len(newtext):]
-    return cipher.encrypt(new_plaintext, key)
+    # Only the counter blocks covering newtext are re-encrypted.
+    ctr_file = CTRFile(bytearray(ciphertext), key)
+    ctr_file.write(offset, newtext)
+    return bytes(ctr_file.buffer)
 
 def get_ciphertext(filename: str) -> bytes:
     """Return ciphertext by CTR mode encryption of the recovered plaintext 
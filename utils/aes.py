@@ -1,9 +1,16 @@
+import sys
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
+from functools import lru_cache
+from typing import Callable, Tuple
 
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.backends import default_backend
 
 from utils.xor import xor
+from utils.padding import PKCS7
 
 class Mode(Enum):
     """Encryption modes"""
@@ -19,14 +26,29 @@ class AES:
     """
     BLOCK_SIZE = 16
     KEY_SIZE = 16
+    # Number of keys whose cipher contexts are kept around.
+    CONTEXT_CACHE_SIZE = 128
+    # Number of CTR counter blocks encrypted with a single ECB call.
+    CTR_BATCH_BLOCKS = 1 << 16
+    # Size of the ranges a message is split into for CBC decryption and CTR.
+    # Must be a multiple of BLOCK_SIZE.
+    CHUNK_SIZE = 1 << 20
 
-    def __init__(self, mode: Mode) -> None:
+    def __init__(self, mode: Mode, workers: int = 1) -> None:
+        """
+        With workers > 1, CBC decryption and CTR process message chunks of
+        CHUNK_SIZE bytes on a pool of that many threads.
+        """
         if isinstance(mode, Mode):
             self.mode = mode
         else:
            raise ValueError(f'Unsupported/Invalid mode {self.mode}') 
+        if workers < 1:
+            raise ValueError('The number of workers must be at least 1')
+        self.workers = workers
 
-    def encrypt(self, plaintext: bytes, key: bytes, iv: bytes = None, nonce: bytes = None) -> bytes:
+    def encrypt(self, plaintext: bytes, key: bytes, iv: bytes = None, nonce: bytes = None,
+                block_offset: int = 0) -> bytes:
         if len(plaintext) % AES.BLOCK_SIZE != 0 and self.mode != Mode.CTR:
             raise ValueError(f'The plaintext must be of length multiple of '
                                 f'block size ({AES.BLOCK_SIZE} bytes).')
@@ -38,13 +60,14 @@ class AES:
         elif self.mode == Mode.CBC:
             ciphertext =  self._encrypt_cbc(plaintext, key, iv)
         elif self.mode == Mode.CTR:
-            ciphertext = self._encrypt_decrypt_ctr(plaintext, key, nonce)
+            ciphertext = self._encrypt_decrypt_ctr(plaintext, key, nonce, block_offset)
         else:
             raise ValueError(f'Unsupported/Invalid mode {self.mode}')
 
         return ciphertext
 
-    def decrypt(self, ciphertext: bytes, key: bytes, iv: bytes = None, nonce: bytes= None) -> bytes:
+    def decrypt(self, ciphertext: bytes, key: bytes, iv: bytes = None, nonce: bytes= None,
+                block_offset: int = 0) -> bytes:
         if len(ciphertext) % AES.BLOCK_SIZE != 0 and self.mode != Mode.CTR:
             raise ValueError(f'The ciphertext must be of length multiple of '
                                 f'block size ({AES.BLOCK_SIZE} bytes).')
@@ -56,38 +79,99 @@ class AES:
         elif self.mode == Mode.CBC:
             plaintext =  self._decrypt_cbc(ciphertext, key, iv)
         elif self.mode == Mode.CTR:
-            plaintext = self._encrypt_decrypt_ctr(ciphertext, key, nonce)
+            plaintext = self._encrypt_decrypt_ctr(ciphertext, key, nonce, block_offset)
         else:
             raise ValueError(f'Unsupported/Invalid mode {self.mode}')
 
         return plaintext
 
+    def encryptor(self, key: bytes, iv: bytes = None, nonce: bytes = None,
+                  padding: bool = False) -> 'AESStream':
+        """
+        Returns a streaming encryptor; feed it with update() and end with finalize().
 
-    def _encrypt_ecb(self, plaintext: bytes, key: bytes) -> bytes:
+        If padding is True, PKCS#7 padding is applied at finalize (ECB, CBC only).
+        """
+        return AESStream(self.mode, key, encrypting=True, iv=iv, nonce=nonce, padding=padding)
+
+    def decryptor(self, key: bytes, iv: bytes = None, nonce: bytes = None,
+                  padding: bool = False) -> 'AESStream':
+        """
+        Returns a streaming decryptor; feed it with update() and end with finalize().
+
+        If padding is True, PKCS#7 padding is removed at finalize (ECB, CBC only).
+        """
+        return AESStream(self.mode, key, encrypting=False, iv=iv, nonce=nonce, padding=padding)
+
+    @staticmethod
+    def _new_context(key: bytes) -> Tuple:
+        """Returns new (encryptor, decryptor) ECB contexts for the given key."""
         backend = default_backend()
         cipher = Cipher(algorithms.AES(key), modes.ECB(), backend=backend)
-        encryptor = cipher.encryptor()
 
-        return encryptor.update(plaintext) + encryptor.finalize()
+        return cipher.encryptor(), cipher.decryptor()
+
+    # Per thread cache of contexts; OpenSSL contexts must not be shared between threads.
+    _thread_contexts = threading.local()
+
+    @staticmethod
+    def _context_cache() -> Callable[[bytes], Tuple]:
+        """Returns the calling thread's LRU cache of contexts by key."""
+        get_context = getattr(AES._thread_contexts, 'get_context', None)
+        if get_context is None:
+            get_context = lru_cache(maxsize=AES.CONTEXT_CACHE_SIZE)(AES._new_context)
+            AES._thread_contexts.get_context = get_context
+
+        return get_context
+
+    @staticmethod
+    def _get_context(key: bytes) -> Tuple:
+        """Returns cached (encryptor, decryptor) ECB contexts for the given key.
+
+        ECB contexts are never finalized, so the same key-scheduled contexts
+        are reused for every block-aligned update() under that key. Each
+        thread has its own cache, so a context is only used by one thread.
+        """
+        return AES._context_cache()(key)
+
+    @staticmethod
+    def cache_info():
+        """Returns hits, misses, maxsize and currsize of the calling thread's context cache."""
+        return AES._context_cache().cache_info()
+
+    @staticmethod
+    def cache_clear() -> None:
+        """Clears the calling thread's context cache and its statistics."""
+        AES._context_cache().cache_clear()
+
+    def _encrypt_ecb(self, plaintext: bytes, key: bytes) -> bytes:
+        if len(plaintext) % AES.BLOCK_SIZE != 0:
+            raise ValueError(f'The plaintext must be of length multiple of '
+                                f'block size ({AES.BLOCK_SIZE} bytes).')
+        encryptor, _ = AES._get_context(bytes(key))
+
+        return encryptor.update(plaintext)
 
     def _decrypt_ecb(self, ciphertext: bytes, key: bytes) -> bytes:
-        backend = default_backend()
-        cipher = Cipher(algorithms.AES(key), modes.ECB(), backend=backend)
-        decryptor = cipher.decryptor()
+        if len(ciphertext) % AES.BLOCK_SIZE != 0:
+            raise ValueError(f'The ciphertext must be of length multiple of '
+                                f'block size ({AES.BLOCK_SIZE} bytes).')
+        _, decryptor = AES._get_context(bytes(key))
 
-        return decryptor.update(ciphertext) + decryptor.finalize()
+        return decryptor.update(ciphertext)
 
     def _encrypt_cbc(self, plaintext: bytes, key: bytes, iv: bytes = None) -> bytes:
         if iv is None:
             iv = bytes(AES.BLOCK_SIZE)
         
+        encryptor, _ = AES._get_context(bytes(key))
         ciphertext = bytes()
         previous_cipher_block = iv
         no_of_blocks = len(plaintext)//AES.BLOCK_SIZE
         for i in range(no_of_blocks):
             current_block = plaintext[i*AES.BLOCK_SIZE:(i+1)*AES.BLOCK_SIZE]
             addition_block = xor(current_block, previous_cipher_block)
-            cipher_block = self._encrypt_ecb(addition_block, key)
+            cipher_block = encryptor.update(addition_block)
             previous_cipher_block = cipher_block
             ciphertext += cipher_block
         
@@ -97,32 +181,221 @@ class AES:
         if iv is None:
             iv = bytes(AES.BLOCK_SIZE)
         
-        plaintext = bytes()
-        previous_block = iv
-        no_of_blocks = len(ciphertext)//AES.BLOCK_SIZE
-        for i in range(no_of_blocks):
-            current_block = ciphertext[i*AES.BLOCK_SIZE:(i+1)*AES.BLOCK_SIZE]
-            ecb_plaintext = self._decrypt_ecb(current_block, key)
-            plaintext += xor(ecb_plaintext, previous_block)
-            previous_block = current_block
-        
-        return plaintext
+        ciphertext = memoryview(ciphertext).cast('B')
+        plaintext = bytearray(len(ciphertext))
+        plaintext_view = memoryview(plaintext)
+
+        # Each plaintext block only depends on its own and the previous ciphertext
+        # block, so any range of blocks is decrypted at once, independently.
+        def decrypt_range(context: Tuple, start: int, end: int) -> None:
+            _, decryptor = context
+            if start == 0:
+                chaining_blocks = bytes(iv) + ciphertext[:end - AES.BLOCK_SIZE]
+            else:
+                chaining_blocks = ciphertext[start - AES.BLOCK_SIZE:end - AES.BLOCK_SIZE]
+            xor(decryptor.update(ciphertext[start:end]), chaining_blocks,
+                out=plaintext_view[start:end])
+
+        self._process_ranges(len(ciphertext), key, decrypt_range)
+
+        return bytes(plaintext)
     
-    def _encrypt_decrypt_ctr(self, text: bytes, key: bytes, nonce: bytes = None) -> bytes:
+    def _encrypt_decrypt_ctr(self, text: bytes, key: bytes, nonce: bytes = None,
+                             block_offset: int = 0) -> bytes:
+        """
+        CTR encrypt/decrypt text, which starts at counter block number block_offset.
+
+        Keystream is generated a batch of counter blocks at a time with a single
+        ECB call and xored against the text a whole batch at once.
+        """
         if nonce is None:
             nonce = bytes(8)
         if len(nonce) != 8:
-            raise ValueError(f'The nonce must be 8 bytes long')
-        
-        plaintext_length = len(text)
-        ciphertext = b''
-        for bytecount in range(0, plaintext_length, AES.BLOCK_SIZE):
-            block_count = bytecount // AES.BLOCK_SIZE
-            counter = nonce + block_count.to_bytes(64//8, 'little')
-            keystream = self._encrypt_ecb(counter, key)
+            raise ValueError('The nonce must be 8 bytes long')
+        if block_offset < 0:
+            raise ValueError('The block offset must not be negative')
 
-            for plaintext_byte, keystream_byte in \
-                        zip(text[bytecount:bytecount+AES.BLOCK_SIZE], keystream):
-                ciphertext += bytes([plaintext_byte ^ keystream_byte])
+        text = memoryview(text).cast('B')
+        output = bytearray(len(text))
+        output_view = memoryview(output)
+        batch_size = AES.CTR_BATCH_BLOCKS * AES.BLOCK_SIZE
 
-        return ciphertext
+        def encrypt_decrypt_range(context: Tuple, range_start: int, range_end: int) -> None:
+            encryptor, _ = context
+            for start in range(range_start, range_end, batch_size):
+                end = min(start + batch_size, range_end)
+                first_block = block_offset + start // AES.BLOCK_SIZE
+                no_of_blocks = (end - start + AES.BLOCK_SIZE - 1) // AES.BLOCK_SIZE
+                counters = AES._ctr_counter_blocks(nonce, first_block, no_of_blocks)
+                keystream = encryptor.update(counters)
+                xor(text[start:end], memoryview(keystream)[:end - start], out=output_view[start:end])
+
+        self._process_ranges(len(text), key, encrypt_decrypt_range)
+
+        return bytes(output)
+
+    def _process_ranges(self, length: int, key: bytes,
+                        process_range: Callable[[Tuple, int, int], None]) -> None:
+        """
+        Calls process_range(context, start, end) over consecutive CHUNK_SIZE ranges
+        covering length bytes, where context is (encryptor, decryptor) for key.
+
+        With more than one worker the ranges are processed concurrently on a thread
+        pool. OpenSSL contexts must not be shared between threads, so each range then
+        gets its own context instead of the cached one.
+        """
+        ranges = [(start, min(start + AES.CHUNK_SIZE, length))
+                  for start in range(0, length, AES.CHUNK_SIZE)]
+        if self.workers == 1 or len(ranges) <= 1:
+            context = AES._get_context(bytes(key))
+            for start, end in ranges:
+                process_range(context, start, end)
+            return
+
+        key = bytes(key)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(process_range, AES._new_context(key), start, end)
+                       for start, end in ranges]
+            for future in futures:
+                future.result()
+
+    @staticmethod
+    def _ctr_counter_blocks(nonce: bytes, first_block: int, no_of_blocks: int) -> bytearray:
+        """
+        Returns no_of_blocks consecutive counter blocks (nonce followed by
+        64-bit little endian block count) starting at first_block, in one buffer.
+        """
+        counters = bytearray(nonce + bytes(8)) * no_of_blocks
+        block_counts = array('Q', range(first_block, first_block + no_of_blocks))
+        if sys.byteorder != 'little':
+            block_counts.byteswap()
+        memoryview(counters).cast('Q')[1::2] = block_counts
+
+        return counters
+
+
+class AESStream:
+    """Incrementally encrypt/decrypt a message using AES.
+
+    Obtained from AES.encryptor()/AES.decryptor(). Input of any length can be
+    passed to update(), which returns as much output as can be produced so far;
+    only a partial block (ECB, CBC) is buffered between calls, so memory use does
+    not depend on the message length. The CBC chaining block and the CTR counter
+    are carried across calls. finalize() returns the remaining output.
+    """
+    def __init__(self, mode: Mode, key: bytes, encrypting: bool, iv: bytes = None,
+                 nonce: bytes = None, padding: bool = False) -> None:
+        if not isinstance(mode, Mode):
+            raise ValueError(f'Unsupported/Invalid mode {mode}')
+        if len(key) != AES.KEY_SIZE:
+            raise ValueError(f'The key must be exact {AES.KEY_SIZE} bytes long')
+        if padding and mode == Mode.CTR:
+            raise ValueError('Padding is not used with CTR mode')
+        if iv is None:
+            iv = bytes(AES.BLOCK_SIZE)
+        if nonce is None:
+            nonce = bytes(8)
+        if len(nonce) != 8:
+            raise ValueError('The nonce must be 8 bytes long')
+
+        self._mode = mode
+        self._key = bytes(key)
+        self._encrypting = encrypting
+        self._padding = padding
+        self._cipher = AES(mode)
+        # A stream may be used from another thread than the one creating it,
+        # so it gets its own contexts rather than cached ones.
+        self._encryptor, self._decryptor = AES._new_context(self._key)
+        self._buffer = bytearray()
+        # CBC: previous ciphertext block; CTR: number of bytes processed so far.
+        self._previous_block = bytes(iv)
+        self._nonce = bytes(nonce)
+        self._position = 0
+        self._finalized = False
+
+    def update(self, data: bytes) -> bytes:
+        if self._finalized:
+            raise ValueError('Stream is already finalized')
+
+        if self._mode == Mode.CTR:
+            return self._update_ctr(data)
+
+        self._buffer += data
+        usable_length = len(self._buffer) - len(self._buffer) % AES.BLOCK_SIZE
+        if self._padding and not self._encrypting and usable_length == len(self._buffer):
+            # Hold back the last block; it holds the padding removed at finalize().
+            usable_length -= AES.BLOCK_SIZE
+        if usable_length <= 0:
+            return b''
+
+        blocks = bytes(self._buffer[:usable_length])
+        del self._buffer[:usable_length]
+
+        return self._process_blocks(blocks)
+
+    def finalize(self) -> bytes:
+        if self._finalized:
+            raise ValueError('Stream is already finalized')
+        self._finalized = True
+
+        if self._mode == Mode.CTR:
+            return b''
+
+        blocks = bytes(self._buffer)
+        self._buffer.clear()
+        if self._padding and self._encrypting:
+            blocks = PKCS7.pad(blocks, AES.BLOCK_SIZE)
+        if len(blocks) % AES.BLOCK_SIZE != 0 or (self._padding and not blocks):
+            raise ValueError(f'The message must be of length multiple of '
+                                f'block size ({AES.BLOCK_SIZE} bytes).')
+        output = self._process_blocks(blocks)
+        if self._padding and not self._encrypting:
+            output = PKCS7.unpad(output)
+
+        return output
+
+    def _process_blocks(self, blocks: bytes) -> bytes:
+        if not blocks:
+            return b''
+
+        if self._mode == Mode.ECB:
+            if self._encrypting:
+                return self._encryptor.update(blocks)
+            return self._decryptor.update(blocks)
+
+        if self._encrypting:
+            output = bytearray()
+            previous_cipher_block = self._previous_block
+            for i in range(0, len(blocks), AES.BLOCK_SIZE):
+                addition_block = xor(blocks[i:i+AES.BLOCK_SIZE], previous_cipher_block)
+                previous_cipher_block = self._encryptor.update(addition_block)
+                output += previous_cipher_block
+            self._previous_block = previous_cipher_block
+            return bytes(output)
+
+        # CBC decryption of each block only needs the previous ciphertext block,
+        # so all the blocks are decrypted and xored at once.
+        chaining_blocks = self._previous_block + blocks[:-AES.BLOCK_SIZE]
+        self._previous_block = blocks[-AES.BLOCK_SIZE:]
+        return xor(self._decryptor.update(blocks), chaining_blocks)
+
+    def _update_ctr(self, data: bytes) -> bytes:
+        data = memoryview(data).cast('B')
+        # Finish the partially used counter block from the previous call first.
+        skip = self._position % AES.BLOCK_SIZE
+        head_length = min((AES.BLOCK_SIZE - skip) % AES.BLOCK_SIZE, len(data))
+        output = b''
+        if head_length:
+            block_count = self._position // AES.BLOCK_SIZE
+            counter = AES._ctr_counter_blocks(self._nonce, block_count, 1)
+            keystream = self._encryptor.update(bytes(counter))[skip:skip+head_length]
+            output = xor(data[:head_length], keystream)
+            self._position += head_length
+
+        rest = data[head_length:]
+        if len(rest):
+            output += self._cipher._encrypt_decrypt_ctr(rest, self._key, self._nonce,
+                                                        self._position // AES.BLOCK_SIZE)
+            self._position += len(rest)
+
+        return output
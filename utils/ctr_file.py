@@ -0,0 +1,88 @@
+import mmap
+from typing import Union
+
+from utils.aes import AES, Mode
+
+class CTRFile:
+    """Random access read/write of AES CTR encrypted data.
+
+    The ciphertext lives in a writable buffer (bytearray, mmap, ...). read()
+    and write() only generate keystream for the counter blocks covering the
+    accessed bytes, so their cost depends on the size of the access, not on
+    the size of the data.
+    """
+    def __init__(self, buffer: Union[bytearray, mmap.mmap], key: bytes, nonce: bytes = None) -> None:
+        if len(key) != AES.KEY_SIZE:
+            raise ValueError(f'The key must be exact {AES.KEY_SIZE} bytes long')
+        self.buffer = buffer
+        self._key = key
+        self._nonce = nonce
+        self._cipher = AES(Mode.CTR)
+        self._file = None
+
+    @classmethod
+    def open(cls, file_name: str, key: bytes, nonce: bytes = None) -> 'CTRFile':
+        """Returns CTRFile backed by memory-mapped ciphertext file."""
+        f = open(file_name, 'r+b')
+        try:
+            buffer = mmap.mmap(f.fileno(), 0)
+        except ValueError:
+            # Empty files cannot be memory-mapped.
+            f.close()
+            raise ValueError(f'Cannot memory-map empty file {file_name}')
+        ctr_file = cls(buffer, key, nonce)
+        ctr_file._file = f
+
+        return ctr_file
+
+    def __len__(self) -> int:
+        return len(self.buffer)
+
+    def __enter__(self) -> 'CTRFile':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self.buffer.close()
+            self._file.close()
+            self._file = None
+
+    def read(self, offset: int, n: int) -> bytes:
+        """Returns up to n bytes of plaintext starting at offset."""
+        if offset < 0 or n < 0:
+            raise ValueError('The offset and length must not be negative')
+        end = min(offset + n, len(self.buffer))
+        if offset >= end:
+            return b''
+
+        return self._crypt(self.buffer[offset:end], offset)
+
+    def write(self, offset: int, data: bytes) -> None:
+        """Replaces the plaintext starting at offset with data.
+
+        Writing past the end grows a bytearray buffer; fixed size buffers
+        (memory-mapped files) cannot grow.
+        """
+        if offset < 0:
+            raise ValueError('The offset must not be negative')
+        if offset > len(self.buffer):
+            raise ValueError(f'The offset must not be past the end ({len(self.buffer)} bytes)')
+        end = offset + len(data)
+        if end > len(self.buffer) and not isinstance(self.buffer, bytearray):
+            raise ValueError(f'Cannot write past the end ({len(self.buffer)} bytes) of a fixed size buffer')
+
+        self.buffer[offset:end] = self._crypt(data, offset)
+
+    def _crypt(self, text: bytes, offset: int) -> bytes:
+        """CTR encrypt/decrypt text that is at offset in the stream."""
+        # Align text to its first counter block; the padding bytes are dropped.
+        skip = offset % AES.BLOCK_SIZE
+        if skip:
+            text = bytes(skip) + text
+        output = self._cipher.decrypt(text, self._key, nonce=self._nonce,
+                                      block_offset=offset // AES.BLOCK_SIZE)
+
+        return output[skip:]
@@ -0,0 +1,268 @@
+"""
+
+Language models for scoring how likely raw bytes are English text
+-----------------------------------------------------------------
+All models score bytes directly (no decoding) and a higher score means more
+likely. Models are chosen by name (see MODELS) or by the path of a model file
+trained on a corpus:
+
+python -m utils.language_model <corpus_file> <output_file> [-k unigram|chi2|bigram]
+
+Model files hold a small header followed by float32 arrays, so they load
+with a single array.frombytes().
+
+"""
+
+import os
+import math
+import struct
+from array import array
+from argparse import ArgumentParser
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Iterable, List, Sequence, Tuple, Union
+
+FREQUENCY_ORDER = ' etaoinsrhldcumfpgwybvkxjqz'
+
+# Relative frequencies of bytes in English text used by the untrained models.
+LETTER_FREQUENCIES = {
+    'a': 8.167, 'b': 1.492, 'c': 2.782, 'd': 4.253, 'e': 12.702, 'f': 2.228, 'g': 2.015,
+    'h': 6.094, 'i': 6.966, 'j': 0.153, 'k': 0.772, 'l': 4.025, 'm': 2.406, 'n': 6.749,
+    'o': 7.507, 'p': 1.929, 'q': 0.095, 'r': 5.987, 's': 6.327, 't': 9.056, 'u': 2.758,
+    'v': 0.978, 'w': 2.360, 'x': 0.150, 'y': 1.974, 'z': 0.074,
+}
+OTHER_FREQUENCIES = {
+    ' ': 20.0, '.': 0.6, ',': 0.6, '\n': 0.4, "'": 0.3, '"': 0.2, '-': 0.15,
+    '!': 0.05, '?': 0.05, ';': 0.03, ':': 0.03,
+}
+UPPERCASE_RATIO = 0.03
+DIGIT_FREQUENCY = 0.05
+PRINTABLE_FREQUENCY = 0.01
+UNPRINTABLE_FREQUENCY = 0.0001
+
+MAGIC = b'CPLM'
+HEADER = struct.Struct('<4s8sI')
+
+class LanguageModel:
+    """
+    Base language model: the score of a text is the sum of per byte scores
+    (byte_scores) of its bytes.
+    """
+    name = None
+
+    def __init__(self, byte_scores: Sequence[float]) -> None:
+        if len(byte_scores) != 256:
+            raise ValueError('A score is needed for each of the 256 byte values')
+        self.byte_scores = byte_scores
+
+    def score(self, text: bytes) -> float:
+        """Return the score of the given text."""
+        return sum(count * self.byte_scores[byte] for byte, count in Counter(text).items())
+
+    def score_keys(self, cipher_bytes: bytes, candidate_keys: Iterable[int]) -> List[float]:
+        """
+        Return the score of cipher_bytes xored with each of the single byte candidate keys.
+        """
+        return self.score_histogram_keys(Counter(cipher_bytes).items(), len(cipher_bytes), candidate_keys)
+
+    def score_histogram_keys(self, histogram: Iterable[Tuple[int, int]], length: int,
+                             candidate_keys: Iterable[int]) -> List[float]:
+        """
+        Return the score, for each of the single byte candidate keys, of the bytes
+        with the given (byte, count) histogram xored with the key. length is the
+        total count.
+
+        The score for a key is the dot product of the histogram with byte_scores
+        permuted by the key, so the bytes are never decrypted one by one.
+        """
+        histogram = list(histogram)
+        return [sum(count * self.byte_scores[byte ^ key] for byte, count in histogram)
+                for key in candidate_keys]
+
+class RankModel(LanguageModel):
+    """
+    Scores each letter (any case) or space by its rank in FREQUENCY_ORDER,
+    and every other byte as -1.
+    """
+    name = 'rank'
+
+    def __init__(self) -> None:
+        byte_scores = []
+        for byte in range(256):
+            pos = FREQUENCY_ORDER.find(chr(byte).lower())
+            byte_scores.append(pos if pos == -1 else len(FREQUENCY_ORDER) - pos)
+        super().__init__(byte_scores)
+
+class UnigramModel(LanguageModel):
+    """Log-likelihood of the text under independent byte probabilities."""
+    name = 'unigram'
+
+    def __init__(self, log_probabilities: Sequence[float] = None) -> None:
+        if log_probabilities is None:
+            log_probabilities = default_log_probabilities()
+        self.log_probabilities = array('f', log_probabilities)
+        super().__init__(self.log_probabilities)
+
+    @classmethod
+    def train(cls, corpus: bytes, smoothing: float = 0.5) -> 'UnigramModel':
+        """Return model with byte probabilities estimated from corpus."""
+        return cls(_log_probabilities(Counter(corpus), smoothing))
+
+    def save(self, file_name: str) -> None:
+        _save_tables(file_name, self.name, [self.log_probabilities])
+
+class ChiSquaredModel(UnigramModel):
+    """
+    Negative chi-squared statistic of the text's byte histogram against the
+    expected byte probabilities.
+    """
+    name = 'chi2'
+
+    def __init__(self, log_probabilities: Sequence[float] = None) -> None:
+        super().__init__(log_probabilities)
+        # Only the observed bytes are needed since, for a text of length n,
+        # sum((h - n*p)^2 / (n*p)) over all bytes == sum(h^2 / p) / n - n.
+        self.inverse_probabilities = [math.exp(-log_p) for log_p in self.log_probabilities]
+
+    def score(self, text: bytes) -> float:
+        histogram = Counter(text).items()
+        return self._score_histogram(histogram, len(text), 0)
+
+    def score_histogram_keys(self, histogram: Iterable[Tuple[int, int]], length: int,
+                             candidate_keys: Iterable[int]) -> List[float]:
+        histogram = list(histogram)
+        return [self._score_histogram(histogram, length, key) for key in candidate_keys]
+
+    def _score_histogram(self, histogram, length: int, key: int) -> float:
+        if not length:
+            return 0.0
+        inverse_probabilities = self.inverse_probabilities
+        weighted = sum(count * count * inverse_probabilities[byte ^ key] for byte, count in histogram)
+        return length - weighted / length
+
+class BigramModel(UnigramModel):
+    """
+    Log-likelihood of the text under a first order Markov chain of bytes.
+    Only meaningful for contiguous text; scoring a histogram uses the
+    unigram probabilities.
+
+    The untrained model has no bigram statistics; its transition
+    probabilities are the unigram ones.
+    """
+    name = 'bigram'
+
+    def __init__(self, log_probabilities: Sequence[float] = None,
+                 transition_log_probabilities: Sequence[float] = None) -> None:
+        super().__init__(log_probabilities)
+        if transition_log_probabilities is None:
+            transition_log_probabilities = self.log_probabilities * 256
+        if len(transition_log_probabilities) != 256 * 256:
+            raise ValueError('A transition score is needed for each of the 256*256 byte pairs')
+        # transition_log_probabilities[a << 8 | b] is log P(b follows a)
+        self.transition_log_probabilities = array('f', transition_log_probabilities)
+
+    @classmethod
+    def train(cls, corpus: bytes, smoothing: float = 0.5) -> 'BigramModel':
+        pair_counts = Counter(zip(corpus, corpus[1:]))
+        transitions = []
+        for a in range(256):
+            row = Counter({b: pair_counts.get((a, b), 0) for b in range(256)})
+            transitions.extend(_log_probabilities(row, smoothing))
+
+        return cls(_log_probabilities(Counter(corpus), smoothing), transitions)
+
+    def score(self, text: bytes) -> float:
+        return self._score_key(text[:1], Counter(zip(text, text[1:])).items(), 0)
+
+    def score_keys(self, cipher_bytes: bytes, candidate_keys: Iterable[int]) -> List[float]:
+        pair_histogram = Counter(zip(cipher_bytes, cipher_bytes[1:])).items()
+        return [self._score_key(cipher_bytes[:1], pair_histogram, key) for key in candidate_keys]
+
+    def _score_key(self, first_byte: bytes, pair_histogram, key: int) -> float:
+        if not first_byte:
+            return 0.0
+        transitions = self.transition_log_probabilities
+        score = self.log_probabilities[first_byte[0] ^ key]
+        score += sum(count * transitions[(a ^ key) << 8 | (b ^ key)]
+                     for (a, b), count in pair_histogram)
+        return score
+
+    def save(self, file_name: str) -> None:
+        _save_tables(file_name, self.name, [self.log_probabilities, self.transition_log_probabilities])
+
+MODELS = {model.name: model for model in (RankModel, UnigramModel, ChiSquaredModel, BigramModel)}
+
+def default_log_probabilities() -> List[float]:
+    """Return byte log-probabilities for English text from the built-in frequencies."""
+    frequencies = {}
+    for byte in range(256):
+        c = chr(byte)
+        if c in LETTER_FREQUENCIES:
+            frequency = LETTER_FREQUENCIES[c]
+        elif c.lower() in LETTER_FREQUENCIES and c.isascii():
+            frequency = LETTER_FREQUENCIES[c.lower()] * UPPERCASE_RATIO
+        elif c in OTHER_FREQUENCIES:
+            frequency = OTHER_FREQUENCIES[c]
+        elif c.isdigit() and c.isascii():
+            frequency = DIGIT_FREQUENCY
+        elif 0x20 <= byte < 0x7f:
+            frequency = PRINTABLE_FREQUENCY
+        else:
+            frequency = UNPRINTABLE_FREQUENCY
+        frequencies[byte] = frequency
+    total = sum(frequencies.values())
+
+    return [math.log(frequencies[byte] / total) for byte in range(256)]
+
+def _log_probabilities(counts: Dict[int, int], smoothing: float) -> List[float]:
+    """Return additive smoothed log-probabilities of the 256 byte values."""
+    total = sum(counts.values()) + 256 * smoothing
+    return [math.log((counts.get(byte, 0) + smoothing) / total) for byte in range(256)]
+
+def _save_tables(file_name: str, name: str, tables: List[array]) -> None:
+    with open(file_name, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, name.encode('ascii'), sum(len(table) for table in tables)))
+        for table in tables:
+            f.write(table.tobytes())
+
+def load_model(file_name: str) -> LanguageModel:
+    """Return the model saved in the given file."""
+    with open(file_name, 'rb') as f:
+        magic, name, length = HEADER.unpack(f.read(HEADER.size))
+        values = array('f')
+        values.frombytes(f.read())
+    name = name.rstrip(b'\x00').decode('ascii')
+    if magic != MAGIC or len(values) != length or name not in MODELS:
+        raise ValueError(f'{file_name} is not a valid model file')
+
+    if name == BigramModel.name:
+        return BigramModel(values[:256], values[256:])
+    return MODELS[name](values)
+
+@lru_cache(maxsize=None)
+def _get_model(name: str) -> LanguageModel:
+    if name in MODELS:
+        return MODELS[name]()
+    if os.path.isfile(name):
+        return load_model(name)
+    raise ValueError(f'Unknown model {name}; use one of {", ".join(MODELS)} or a model file')
+
+def get_model(model: Union[str, LanguageModel]) -> LanguageModel:
+    """Return the model with the given name (see MODELS), or saved in the given file."""
+    if isinstance(model, LanguageModel):
+        return model
+    return _get_model(model)
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Train a language model on a corpus file')
+    parser.add_argument('corpus_file')
+    parser.add_argument('output_file')
+    parser.add_argument('-k', '--kind', choices=[name for name in MODELS if name != RankModel.name],
+                        default=UnigramModel.name)
+
+    args = parser.parse_args()
+    with open(args.corpus_file, 'rb') as f:
+        corpus = f.read()
+    model = MODELS[args.kind].train(corpus)
+    model.save(args.output_file)
+    print(f'Saved {args.kind} model trained on {len(corpus)} bytes to {args.output_file}')
@@ -0,0 +1,161 @@
+"""
+
+Oracles with call accounting, response caching and simulated latency
+--------------------------------------------------------------------
+Attacks query an oracle by calling it with the same arguments as the wrapped
+function. SyncOracle answers directly, AsyncOracle answers from a coroutine so
+that many queries can be in flight at once. Both can cache the responses of a
+deterministic oracle, add simulated network latency (with jitter) to every
+query that is not answered from the cache, and keep OracleStats.
+
+"""
+
+import time
+import random
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional, Protocol
+
+class Oracle(Protocol):
+    """Anything attacks can query: oracle(*args) -> response."""
+    def __call__(self, *args: Any) -> Any:
+        ...
+
+class OracleStats:
+    """Counters of the queries made to an oracle."""
+    def __init__(self) -> None:
+        self.queries = 0
+        self.cache_hits = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        # Total time spent waiting for the oracle (including simulated latency),
+        # and the time from first to last query.
+        self.oracle_time = 0.0
+        self._first_query = None
+        self._last_response = None
+
+    @property
+    def wall_time(self) -> float:
+        if self._first_query is None:
+            return 0.0
+        return self._last_response - self._first_query
+
+    @property
+    def queries_per_second(self) -> float:
+        return self.queries / self.wall_time if self.wall_time else 0.0
+
+    def __repr__(self) -> str:
+        return (f'OracleStats(queries={self.queries}, cache_hits={self.cache_hits}, '
+                f'bytes_sent={self.bytes_sent}, bytes_received={self.bytes_received}, '
+                f'oracle_time={self.oracle_time:.3f}s, wall_time={self.wall_time:.3f}s)')
+
+def _size(value: Any) -> int:
+    return len(value) if isinstance(value, (bytes, bytearray, memoryview)) else 0
+
+def _cache_key(args: tuple) -> tuple:
+    return tuple(bytes(arg) if isinstance(arg, (bytearray, memoryview)) else arg for arg in args)
+
+class _BaseOracle:
+    def __init__(self, function: Callable[..., Any], cache_size: int = 0,
+                 latency: float = 0.0, jitter: float = 0.0) -> None:
+        """
+        function: the oracle to wrap.
+        cache_size: number of responses cached (0 disables caching); only for
+            deterministic oracles.
+        latency, jitter: each query takes latency +/- up to jitter extra seconds.
+        """
+        self._function = function
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._latency = latency
+        self._jitter = jitter
+        self._lock = threading.Lock()
+        self.stats = OracleStats()
+
+    def _delay(self) -> float:
+        return max(0.0, self._latency + random.uniform(-self._jitter, self._jitter))
+
+    def _cached(self, args: tuple) -> Optional[tuple]:
+        """Returns (response,) if the response to args is cached."""
+        if not self._cache_size:
+            return None
+        key = _cache_key(args)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.stats.cache_hits += 1
+                return (self._cache[key],)
+        return None
+
+    def _record(self, args: tuple, response: Any, start: float, end: float) -> None:
+        with self._lock:
+            stats = self.stats
+            stats.queries += 1
+            stats.bytes_sent += sum(_size(arg) for arg in args)
+            stats.bytes_received += _size(response)
+            stats.oracle_time += end - start
+            if stats._first_query is None:
+                stats._first_query = start
+            stats._last_response = end if stats._last_response is None else max(stats._last_response, end)
+            if self._cache_size:
+                self._cache[_cache_key(args)] = response
+                if len(self._cache) > self._cache_size:
+                    self._cache.popitem(last=False)
+
+class SyncOracle(_BaseOracle):
+    """Oracle answering each query in the calling thread."""
+    def __call__(self, *args: Any) -> Any:
+        cached = self._cached(args)
+        if cached is not None:
+            return cached[0]
+
+        start = time.perf_counter()
+        delay = self._delay()
+        if delay:
+            time.sleep(delay)
+        response = self._function(*args)
+        self._record(args, response, start, time.perf_counter())
+
+        return response
+
+class AsyncOracle(_BaseOracle):
+    """
+    Oracle answering each query from a coroutine: await oracle(*args).
+
+    With caching enabled, a query identical to one still in flight waits for
+    that query's response instead of being sent again.
+    """
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._in_flight = {}
+
+    def __call__(self, *args: Any) -> Awaitable[Any]:
+        return self.query(*args)
+
+    async def query(self, *args: Any) -> Any:
+        cached = self._cached(args)
+        if cached is not None:
+            return cached[0]
+        if self._cache_size:
+            key = _cache_key(args)
+            if key in self._in_flight:
+                self.stats.cache_hits += 1
+                return await asyncio.shield(self._in_flight[key])
+            self._in_flight[key] = asyncio.get_running_loop().create_future()
+
+        try:
+            start = time.perf_counter()
+            delay = self._delay()
+            if delay:
+                await asyncio.sleep(delay)
+            response = self._function(*args)
+            self._record(args, response, start, time.perf_counter())
+        except BaseException as e:
+            if self._cache_size:
+                self._in_flight.pop(key).set_exception(e)
+            raise
+        if self._cache_size:
+            self._in_flight.pop(key).set_result(response)
+
+        return response
@@ -1,11 +1,61 @@
-def xor(x: bytes, y: bytes) -> bytes:
+from typing import Optional, Union
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+# Operands are xored in chunks of (about) this many bytes so that large
+# buffers never need more than a chunk worth of temporary integers.
+CHUNK_SIZE = 1 << 20
+
+def xor(x: Buffer, y: Buffer, out: Optional[Union[bytearray, memoryview]] = None) -> Buffer:
     """Performs xor operation between x and y.
-    
+
     If x and y are of unequal length, repeat the short one.
+
+    Whole chunks of the operands are xored as big integers instead of byte
+    by byte. If out (a writable buffer at least as long as the longer operand)
+    is given, the result is written into it and out is returned; out may be
+    one of the operands for in-place use. Otherwise new bytes are returned.
     """
-    xored = bytes()
-    x_len, y_len = len(x), len(y)
-    for i in range(max(x_len, y_len)):
-        xored += bytes([x[i%x_len] ^ y[i%y_len]])
+    if len(x) < len(y):
+        x, y = y, x
+    length, short_length = len(x), len(y)
+    if length == 0:
+        return b'' if out is None else out
+    if short_length == 0:
+        raise ValueError('Cannot xor against an empty operand')
+
+    x_view = memoryview(x).cast('B')
+    if short_length == length:
+        step = CHUNK_SIZE
+        y_view = memoryview(y).cast('B')
+    else:
+        # Keep every chunk starting at phase 0 of the short operand, so a single
+        # tiled copy of it serves all chunks.
+        step = max(CHUNK_SIZE // short_length, 1) * short_length
+        y_view = memoryview(bytes(y) * (min(step, length) // short_length + 1))
+
+    if out is None:
+        chunks = []
+    else:
+        out_view = memoryview(out).cast('B')
+        if out_view.readonly:
+            raise ValueError('The output buffer must be writable')
+        if len(out_view) < length:
+            raise ValueError(f'The output buffer must be at least {length} bytes long')
+
+    for start in range(0, length, step):
+        end = min(start + step, length)
+        x_int = int.from_bytes(x_view[start:end], 'little')
+        if short_length == length:
+            y_int = int.from_bytes(y_view[start:end], 'little')
+        else:
+            y_int = int.from_bytes(y_view[:end - start], 'little')
+        chunk = (x_int ^ y_int).to_bytes(end - start, 'little')
+        if out is None:
+            chunks.append(chunk)
+        else:
+            out_view[start:end] = chunk
 
-    return xored
\ No newline at end of file
+    if out is None:
+        return b''.join(chunks)
+    return out